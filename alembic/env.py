@@ -1,3 +1,4 @@
+import os
 import sys
 from pathlib import Path as PathLib
 from logging.config import fileConfig
@@ -6,6 +7,9 @@ from alembic import context
 sys.path.insert(0, str(PathLib(__file__).parents[1]))
 from databases.databases import Base
 config = context.config
+if os.getenv("DATABASE_URL"):
+    config.set_main_option("sqlalchemy.url",
+                           os.environ["DATABASE_URL"].replace("+aiosqlite", "").replace("+asyncpg", ""))
 
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
@@ -13,6 +17,10 @@ if config.config_file_name is not None:
 target_metadata = Base.metadata
 
 
+def include_object(object, name, type_, reflected, compare_to):
+    return not (type_ == "table" and name.startswith("messages_fts"))
+
+
 def run_migrations_offline():
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
@@ -20,6 +28,7 @@ def run_migrations_offline():
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        include_object=include_object,
     )
     with context.begin_transaction():
         context.run_migrations()
@@ -35,7 +44,8 @@ def run_migrations_online():
         context.configure(
             connection=connection,
             target_metadata=target_metadata,
-            render_as_batch=True
+            render_as_batch=True,
+            include_object=include_object
         )
         with context.begin_transaction():
             context.run_migrations()
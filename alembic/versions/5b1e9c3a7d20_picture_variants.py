@@ -0,0 +1,38 @@
+"""picture variants
+
+Revision ID: 5b1e9c3a7d20
+Revises: d095f5db19c2
+Create Date: 2026-10-17 03:12:41.208113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b1e9c3a7d20'
+down_revision: Union[str, Sequence[str], None] = 'd095f5db19c2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('picture_variants',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('picture_id', sa.Integer(), nullable=False),
+    sa.Column('width', sa.Integer(), nullable=False),
+    sa.Column('media_type', sa.String(length=32), nullable=False),
+    sa.Column('filepath', sa.String(length=512), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['picture_id'], ['pictures.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('picture_id', 'width', name='uq_picture_variants_picture_width')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('picture_variants')
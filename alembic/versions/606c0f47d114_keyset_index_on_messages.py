@@ -0,0 +1,30 @@
+"""keyset index on messages (chat_id, id)
+
+Revision ID: 606c0f47d114
+Revises: 780577e0557a
+Create Date: 2026-10-17 02:20:41.538102
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '606c0f47d114'
+down_revision: Union[str, Sequence[str], None] = '780577e0557a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('idx_messages_chat_id', 'messages', ['chat_id', 'id'], unique=False)
+    op.drop_index('idx_messages_chat_sent', table_name='messages')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('idx_messages_chat_sent', 'messages', ['chat_id', 'sent_at'], unique=False)
+    op.drop_index('idx_messages_chat_id', table_name='messages')
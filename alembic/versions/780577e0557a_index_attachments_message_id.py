@@ -0,0 +1,28 @@
+"""index attachments.message_id
+
+Revision ID: 780577e0557a
+Revises: 0c8594b2befd
+Create Date: 2026-10-17 02:15:03.184520
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '780577e0557a'
+down_revision: Union[str, Sequence[str], None] = '0c8594b2befd'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_attachments_message_id'), 'attachments', ['message_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_attachments_message_id'), table_name='attachments')
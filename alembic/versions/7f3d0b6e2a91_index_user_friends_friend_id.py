@@ -0,0 +1,30 @@
+"""index user_friends friend_id
+
+Revision ID: 7f3d0b6e2a91
+Revises: e4a7c2f9b813
+Create Date: 2026-10-17 04:22:16.093418
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f3d0b6e2a91'
+down_revision: Union[str, Sequence[str], None] = 'e4a7c2f9b813'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('user_friends') as batch_op:
+        batch_op.create_index('ix_user_friends_friend_id', ['friend_id', 'user_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('user_friends') as batch_op:
+        batch_op.drop_index('ix_user_friends_friend_id')
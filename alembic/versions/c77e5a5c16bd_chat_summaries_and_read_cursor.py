@@ -0,0 +1,55 @@
+"""chat summaries and read cursor
+
+Revision ID: c77e5a5c16bd
+Revises: 606c0f47d114
+Create Date: 2026-10-17 02:31:12.904417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c77e5a5c16bd'
+down_revision: Union[str, Sequence[str], None] = '606c0f47d114'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('chat_summaries',
+    sa.Column('chat_id', sa.Integer(), nullable=False),
+    sa.Column('last_message_id', sa.Integer(), nullable=True),
+    sa.Column('last_user_id', sa.Integer(), nullable=True),
+    sa.Column('last_text', sa.String(length=100), nullable=True),
+    sa.Column('last_activity_at', sa.DateTime(), nullable=False),
+    sa.Column('message_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['chat_id'], ['chats.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('chat_id')
+    )
+    with op.batch_alter_table('chat_members') as batch_op:
+        batch_op.add_column(sa.Column('last_read_message_id', sa.Integer(), server_default='0', nullable=False))
+    op.create_index(op.f('ix_chat_members_user_id'), 'chat_members', ['user_id'], unique=False)
+    op.execute("""
+        INSERT INTO chat_summaries (chat_id, last_message_id, last_user_id, last_text, last_activity_at, message_count)
+        SELECT chats.id, last.id, last.user_id, substr(last.text, 1, 100), COALESCE(last.sent_at, CURRENT_TIMESTAMP),
+               (SELECT count(*) FROM messages WHERE messages.chat_id = chats.id)
+        FROM chats
+        LEFT JOIN messages AS last
+            ON last.id = (SELECT max(messages.id) FROM messages WHERE messages.chat_id = chats.id)
+    """)
+    op.execute("""
+        UPDATE chat_members SET last_read_message_id = COALESCE(
+            (SELECT last_message_id FROM chat_summaries WHERE chat_summaries.chat_id = chat_members.chat_id), 0)
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_chat_members_user_id'), table_name='chat_members')
+    with op.batch_alter_table('chat_members') as batch_op:
+        batch_op.drop_column('last_read_message_id')
+    op.drop_table('chat_summaries')
@@ -0,0 +1,42 @@
+"""content addressed blobs
+
+Revision ID: d095f5db19c2
+Revises: c77e5a5c16bd
+Create Date: 2026-10-17 02:44:27.617020
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd095f5db19c2'
+down_revision: Union[str, Sequence[str], None] = 'c77e5a5c16bd'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('blobs',
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('filepath', sa.String(length=512), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('refcount', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('sha256')
+    )
+    with op.batch_alter_table('attachments') as batch_op:
+        batch_op.add_column(sa.Column('sha256', sa.String(length=64), nullable=True))
+        batch_op.create_foreign_key('fk_attachments_sha256_blobs', 'blobs', ['sha256'], ['sha256'])
+        batch_op.create_index(batch_op.f('ix_attachments_sha256'), ['sha256'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('attachments') as batch_op:
+        batch_op.drop_index(batch_op.f('ix_attachments_sha256'))
+        batch_op.drop_constraint('fk_attachments_sha256_blobs', type_='foreignkey')
+        batch_op.drop_column('sha256')
+    op.drop_table('blobs')
@@ -0,0 +1,40 @@
+"""message search index
+
+Revision ID: e4a7c2f9b813
+Revises: 5b1e9c3a7d20
+Create Date: 2026-10-17 03:41:05.552907
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a7c2f9b813'
+down_revision: Union[str, Sequence[str], None] = '5b1e9c3a7d20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("ALTER TABLE messages ADD COLUMN search_vector tsvector "
+                   "GENERATED ALWAYS AS (to_tsvector('simple', text)) STORED")
+        op.create_index('ix_messages_search_vector', 'messages', ['search_vector'], unique=False,
+                        postgresql_using='gin')
+        return
+    op.execute("CREATE VIRTUAL TABLE messages_fts "
+               "USING fts5(text, tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+    op.execute("INSERT INTO messages_fts(rowid, text) SELECT id, text FROM messages")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_messages_search_vector', table_name='messages', postgresql_using='gin')
+        op.drop_column('messages', 'search_vector')
+        return
+    op.execute("DROP TABLE messages_fts")
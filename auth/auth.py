@@ -4,7 +4,9 @@ from pydantic import BaseModel, EmailStr, Field
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from databases.databases import get_db, UserModel
-from auth.crypto import verify_password, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES, get_password_hash
+from auth.ratelimit import limit_by_ip, LOGIN_IP_LIMIT, REGISTER_IP_LIMIT
+from auth.crypto import verify_password_async, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES, get_password_hash_async
+from users.directory import user_directory
 from datetime import timedelta
 
 auth_router = APIRouter(prefix="/auth", tags=["auth"])
@@ -18,15 +20,16 @@ class RegisterSchema(BaseModel):
     bio: None | str = Field(max_length=255)
 
 
-@auth_router.post("/register")
+@auth_router.post("/register", dependencies=[Depends(limit_by_ip(REGISTER_IP_LIMIT))])
 async def register(schema: RegisterSchema, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(UserModel).where(UserModel.email == schema.email))
+    result = await db.execute(select(UserModel).where(UserModel.email == schema.email, UserModel.deleted_at.is_(None)))
     if result.scalar_one_or_none():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
-    hashed_pwd = get_password_hash(schema.pwd)
+    await db.close()
+    hashed_pwd = await get_password_hash_async(schema.pwd)
     new_user = UserModel(
         email=schema.email,
         hash_pwd=hashed_pwd,
@@ -37,18 +40,21 @@ async def register(schema: RegisterSchema, db: AsyncSession = Depends(get_db)):
     db.add(new_user)
     await db.commit()
     await db.refresh(new_user)
+    user_directory.add(new_user.id, new_user.name, new_user.lastname, new_user.email)
     return {"ok": True, "user_id": new_user.id}
 
 
-@auth_router.post("/login")
+@auth_router.post("/login", dependencies=[Depends(limit_by_ip(LOGIN_IP_LIMIT))])
 async def login(
         form_data: OAuth2PasswordRequestForm = Depends(),
         db: AsyncSession = Depends(get_db)
 ):
-    result = await db.execute(select(UserModel).where(UserModel.email == form_data.username))
+    result = await db.execute(select(UserModel).where(UserModel.email == form_data.username,
+                                                      UserModel.deleted_at.is_(None)))
     user = result.scalar_one_or_none()
+    await db.close()
 
-    if not user or not verify_password(form_data.password, user.hash_pwd):
+    if not user or not await verify_password_async(form_data.password, user.hash_pwd):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
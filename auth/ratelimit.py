@@ -0,0 +1,124 @@
+import math
+import os
+import time
+from fastapi import Depends, HTTPException, Request, Response, status
+from auth.validation import get_current_user
+
+try:
+    import redis.asyncio as redis
+except ImportError:
+    redis = None
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+RATE_LIMIT_SWEEP_SECONDS = float(os.getenv("RATE_LIMIT_SWEEP_SECONDS", "60"))
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "0") == "1"
+
+REDIS_TAKE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local tat = tonumber(redis.call('GET', KEYS[1]) or ARGV[1])
+if tat < now then tat = now end
+local new_tat = tat + interval
+if new_tat - now > burst then return {0, tostring(new_tat - now - burst)} end
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+return {1, tostring(new_tat - now)}
+"""
+
+
+class RateLimit:
+    def __init__(self, name: str, spec: str):
+        count, seconds = spec.split("/")
+        self.name = name
+        self.capacity = int(count)
+        self.interval = float(seconds) / self.capacity
+        self.burst = self.capacity * self.interval
+
+
+class MemoryBuckets:
+    def __init__(self, sweep_seconds: float = RATE_LIMIT_SWEEP_SECONDS):
+        self.sweep_seconds = sweep_seconds
+        self.sweep_at = time.monotonic() + sweep_seconds
+        # (limit name, key) -> theoretical arrival time; absent means a full bucket
+        self.buckets: dict[tuple[str, object], float] = {}
+
+    async def take(self, limit: RateLimit, key) -> tuple[bool, float]:
+        now = time.monotonic()
+        if now >= self.sweep_at:
+            self.sweep(now)
+        bucket = (limit.name, key)
+        new_tat = max(self.buckets.get(bucket, now), now) + limit.interval
+        if new_tat - now > limit.burst:
+            return False, new_tat - now - limit.burst
+        self.buckets[bucket] = new_tat
+        return True, new_tat - now
+
+    def sweep(self, now: float):
+        self.buckets = {bucket: tat for bucket, tat in self.buckets.items() if tat > now}
+        self.sweep_at = now + self.sweep_seconds
+
+
+class RedisBuckets:
+    def __init__(self, url: str = RATE_LIMIT_REDIS_URL):
+        if redis is None:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis needs the redis package")
+        self.client = redis.from_url(url)
+        self.script = self.client.register_script(REDIS_TAKE_SCRIPT)
+
+    async def take(self, limit: RateLimit, key) -> tuple[bool, float]:
+        allowed, seconds = await self.script(keys=[f"ratelimit:{limit.name}:{key}"],
+                                             args=[time.time(), limit.interval, limit.burst])
+        return bool(allowed), float(seconds)
+
+
+async def hit(limit: RateLimit, key, response: Response):
+    if not RATE_LIMIT_ENABLED:
+        return
+    allowed, seconds = await rate_limit_store.take(limit, key)
+    if not allowed:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests",
+            headers={
+                "Retry-After": str(math.ceil(seconds)),
+                "RateLimit-Limit": str(limit.capacity),
+                "RateLimit-Remaining": "0",
+                "RateLimit-Reset": str(math.ceil(seconds))
+            }
+        )
+    remaining = int((limit.burst - seconds) / limit.interval + 1e-9)
+    current = response.headers.get("RateLimit-Remaining")
+    if current is None or remaining < int(current):
+        response.headers["RateLimit-Limit"] = str(limit.capacity)
+        response.headers["RateLimit-Remaining"] = str(remaining)
+        response.headers["RateLimit-Reset"] = str(math.ceil(seconds))
+
+
+def client_ip(request: Request) -> str:
+    forwarded = request.headers.get("X-Forwarded-For") if TRUST_FORWARDED_FOR else None
+    if forwarded:
+        return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def limit_by_user(limit: RateLimit):
+    async def dependency(response: Response, user_id: int = Depends(get_current_user)):
+        await hit(limit, user_id, response)
+    return dependency
+
+
+def limit_by_ip(limit: RateLimit):
+    async def dependency(request: Request, response: Response):
+        await hit(limit, client_ip(request), response)
+    return dependency
+
+
+SEND_MESSAGE_USER_LIMIT = RateLimit("send_message_user", os.getenv("SEND_MESSAGE_USER_LIMIT", "30/10"))
+SEND_MESSAGE_CHAT_LIMIT = RateLimit("send_message_chat", os.getenv("SEND_MESSAGE_CHAT_LIMIT", "200/10"))
+NEW_CHAT_USER_LIMIT = RateLimit("new_chat_user", os.getenv("NEW_CHAT_USER_LIMIT", "10/60"))
+LOGIN_IP_LIMIT = RateLimit("login_ip", os.getenv("LOGIN_IP_LIMIT", "10/60"))
+REGISTER_IP_LIMIT = RateLimit("register_ip", os.getenv("REGISTER_IP_LIMIT", "10/600"))
+
+rate_limit_store = RedisBuckets() if RATE_LIMIT_BACKEND == "redis" else MemoryBuckets()
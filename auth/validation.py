@@ -1,15 +1,21 @@
+import time
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from databases.databases import get_db, UserModel
-from auth.crypto import SECRET_KEY, ALGORITHM
+from auth import cache
+from auth.crypto import SECRET_KEY, ALGORITHM, STATELESS_AUTH, ACCESS_TOKEN_EXPIRE_MINUTES
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
 
 async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> int:
+    return await verify_token(token, db)
+
+
+async def verify_token(token: str, db: AsyncSession) -> int:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -22,7 +28,18 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    result = await db.execute(select(UserModel).where(UserModel.id == int(user_id)))
-    if not result.scalar_one_or_none():
+    user_id = int(user_id)
+    revoked_before = cache.verification_cache.get(user_id)
+    if revoked_before is None:
+        if STATELESS_AUTH:
+            return user_id
+        result = await db.execute(select(UserModel.id).where(UserModel.id == user_id, UserModel.deleted_at.is_(None)))
+        revoked_before = 0.0 if result.scalar_one_or_none() else time.time()
+        cache.verification_cache.set(user_id, revoked_before)
+    if payload.get("iat", 0) < revoked_before:
         raise credentials_exception
-    return int(user_id)
\ No newline at end of file
+    return user_id
+
+
+def revoke_user(user_id: int):
+    cache.verification_cache.set(user_id, time.time(), ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
\ No newline at end of file
@@ -0,0 +1,88 @@
+# python -m benchmarks.avatar_variants
+import asyncio
+import os
+import tempfile
+import time
+from pathlib import Path as PathLib
+import httpx
+from fastapi import FastAPI, Query, Request
+from PIL import Image
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from databases.databases import Base, UserModel, PictureModel, create_engine_from_settings
+from media.MediaInfo import MEDIA_ROOT
+from users.users import get_pictures, avatar_response
+
+AVATARS = 50
+ORIGINAL_SIZE = 2048
+ROUNDS = 20
+
+
+def make_app(session_maker) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/avatar/{user_id}")
+    async def serve(request: Request, user_id: int, size: int | None = Query(default=None)):
+        async with session_maker() as db:
+            result = await get_pictures(user_id, db, "avatar")
+            return await avatar_response(request, db, next(iter(result), None), size)
+
+    return app
+
+
+async def populate(session_maker):
+    picture_dir = PathLib(MEDIA_ROOT) / "pictures"
+    picture_dir.mkdir(parents=True, exist_ok=True)
+    image = Image.effect_mandelbrot((ORIGINAL_SIZE, ORIGINAL_SIZE), (-2, -1.5, 1, 1.5), 100).convert("RGB")
+    async with session_maker() as db:
+        for user_id in range(1, AVATARS + 1):
+            filepath = f"pictures/bench-{user_id}.jpg"
+            image.save(PathLib(MEDIA_ROOT) / filepath, quality=90)
+            db.add(UserModel(id=user_id, name="bench", lastname="bench", hash_pwd="", bio="",
+                             email=f"bench{user_id}@example.com"))
+            await db.flush()
+            db.add(PictureModel(filename=f"bench-{user_id}.jpg", filepath=filepath, owner_id=user_id,
+                                size=os.path.getsize(PathLib(MEDIA_ROOT) / filepath), placement="avatar"))
+        await db.commit()
+
+
+async def chat_list(client, size):
+    params = {"size": size} if size else {}
+
+    async def fetch(user_id):
+        start = time.perf_counter()
+        response = await client.get(f"/avatar/{user_id}", params=params)
+        return (time.perf_counter() - start) * 1000, len(response.content)
+
+    return await asyncio.gather(*(fetch(user_id) for user_id in range(1, AVATARS + 1)))
+
+
+def p99(values):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * 0.99))]
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        engine = create_engine_from_settings(f"sqlite+aiosqlite:///{tmp}/bench.db", echo=False)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_maker = async_sessionmaker(engine, expire_on_commit=False)
+        await populate(session_maker)
+        transport = httpx.ASGITransport(app=make_app(session_maker))
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            print(f"chat list of {AVATARS} avatars, {ORIGINAL_SIZE}px originals")
+            print(f"{'variant':>12} {'KB/list':>9} {'p99 ms':>8}")
+            for name, size, rounds in (("original", None, ROUNDS), ("64 cold", 64, 1), ("64 warm", 64, ROUNDS),
+                                       ("256 cold", 256, 1), ("256 warm", 256, ROUNDS)):
+                timings, transferred = [], 0
+                for _ in range(rounds):
+                    results = await chat_list(client, size)
+                    timings += [elapsed for elapsed, _ in results]
+                    transferred += sum(length for _, length in results)
+                print(f"{name:>12} {transferred / rounds / 1024:>9.0f} {p99(timings):>8.1f}")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
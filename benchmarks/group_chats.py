@@ -0,0 +1,88 @@
+# python -m benchmarks.group_chats
+import asyncio
+import statistics
+import tempfile
+import time
+from sqlalchemy import event, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from databases.databases import Base, UserModel, ChatModel, ChatMember, ChatSummary, create_engine_from_settings
+from chats.chats import SetChatSchema, ChatMembersSchema, create_chat, add_chat_members
+
+USERS = 20_000
+GROUP_SIZES = (10, 100, 1_000, 10_000)
+ROUNDS = 5
+
+counter = {"statements": 0}
+
+
+async def create_chat_per_member(schema, owner_id, db):
+    for member in schema.members_id:
+        result = await db.execute(select(UserModel).where(UserModel.id == member))
+        result.scalar_one()
+    result = await db.execute(select(UserModel.name).where(UserModel.id == owner_id))
+    chat = ChatModel(is_private=False, name=result.scalar_one() + " chat", status="opened")
+    db.add(chat)
+    await db.flush()
+    db.add(ChatSummary(chat_id=chat.id, message_count=0))
+    db.add(ChatMember(user_id=owner_id, chat_id=chat.id, role="owner"))
+    for member in schema.members_id:
+        if member != owner_id:
+            db.add(ChatMember(user_id=member, chat_id=chat.id, role="member"))
+    await db.commit()
+
+
+async def create_chat_batched(schema, owner_id, db):
+    await create_chat(schema, owner_id, db)
+
+
+async def add_members_batched(schema, owner_id, db):
+    result = await create_chat(SetChatSchema(members_id={2, 3}, name="bench"), owner_id, db)
+    counter["statements"] = 0
+    user_ids = schema.members_id - {max(schema.members_id)}
+    await add_chat_members(ChatMembersSchema(user_ids=user_ids), result["chat_id"], owner_id, db)
+
+
+def count_statement(*args):
+    counter["statements"] += 1
+
+
+async def measure(session_maker, create, size):
+    timings, statements = [], []
+    for _ in range(ROUNDS):
+        schema = SetChatSchema(members_id=set(range(2, size + 2)), name=None)
+        counter["statements"] = 0
+        start = time.perf_counter()
+        async with session_maker() as db:
+            await create(schema, 1, db)
+        timings.append((time.perf_counter() - start) * 1000)
+        statements.append(counter["statements"])
+    return statistics.median(timings), max(statements)
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine_from_settings(f"sqlite+aiosqlite:///{tmp}/bench.db", echo=False)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_maker = async_sessionmaker(engine, expire_on_commit=False)
+        async with session_maker() as db:
+            await db.execute(insert(UserModel), [
+                {"id": i, "name": f"user{i}", "lastname": "bench", "hash_pwd": "", "bio": "",
+                 "email": f"user{i}@example.com"}
+                for i in range(1, USERS + 1)
+            ])
+            await db.commit()
+        event.listen(engine.sync_engine, "before_cursor_execute", count_statement)
+        print(f"{'members':>8} {'per-member ms':>14} {'round trips':>12} {'batched ms':>11} {'round trips':>12} "
+              f"{'bulk add ms':>12} {'round trips':>12}")
+        for size in GROUP_SIZES:
+            old_ms, old_trips = await measure(session_maker, create_chat_per_member, size)
+            new_ms, new_trips = await measure(session_maker, create_chat_batched, size)
+            add_ms, add_trips = await measure(session_maker, add_members_batched, size)
+            print(f"{size:>8} {old_ms:>14.1f} {old_trips:>12} {new_ms:>11.1f} {new_trips:>12} "
+                  f"{add_ms:>12.1f} {add_trips:>12}")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,63 @@
+# python -m benchmarks.login_load
+import asyncio
+import statistics
+import tempfile
+import time
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from databases.databases import Base, UserModel, ChatModel, MessageModel
+from auth.crypto import verify_password, verify_password_async, get_password_hash
+
+LOGINS = 40
+SENDS = 100
+
+
+async def login_blocking(hashed):
+    await asyncio.sleep(0)
+    verify_password("password", hashed)
+
+
+async def login_pooled(hashed):
+    await verify_password_async("password", hashed)
+
+
+async def send_messages(session_maker):
+    timings = []
+    for i in range(SENDS):
+        start = time.perf_counter()
+        async with session_maker() as db:
+            db.add(MessageModel(user_id=1, chat_id=1, text=f"message {i}"))
+            await db.commit()
+        timings.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.005)
+    return timings
+
+
+async def run(session_maker, login, hashed):
+    logins = [asyncio.create_task(login(hashed)) for _ in range(LOGINS)]
+    timings = await send_messages(session_maker)
+    await asyncio.gather(*logins)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.99) - 1], timings[-1]
+
+
+async def main():
+    hashed = get_password_hash("password")
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp}/bench.db")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_maker = async_sessionmaker(engine, expire_on_commit=False)
+        async with session_maker() as db:
+            db.add(UserModel(id=1, name="bench", lastname="bench", hash_pwd=hashed, bio="", email="bench@example.com"))
+            db.add(ChatModel(id=1, is_private=False, name="bench"))
+            await db.commit()
+        print(f"{LOGINS} concurrent logins, {SENDS} message sends")
+        print(f"{'mode':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        for name, login in (("blocking", login_blocking), ("pooled", login_pooled)):
+            p50, p99, worst = await run(session_maker, login, hashed)
+            print(f"{name:>9} {p50:>8.2f} {p99:>8.2f} {worst:>8.2f}")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
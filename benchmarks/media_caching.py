@@ -0,0 +1,58 @@
+# python -m benchmarks.media_caching
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path as PathLib
+import httpx
+from fastapi import FastAPI, Request
+from media.responses import media_response
+
+FILE_SIZE = 8 * 1024 * 1024
+REQUESTS = 50
+
+
+def make_app(path: PathLib) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/file")
+    async def serve(request: Request):
+        return media_response(request, path, etag="bench", media_type="video/mp4", filename="video.mp4",
+                              immutable=True)
+
+    return app
+
+
+async def scenario(client, headers):
+    timings = []
+    transferred = 0
+    for i in range(REQUESTS):
+        start = time.perf_counter()
+        response = await client.get("/file", headers=headers(i))
+        transferred += len(response.content)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), transferred / REQUESTS
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = PathLib(tmp) / "video.mp4"
+        path.write_bytes(os.urandom(FILE_SIZE))
+        transport = httpx.ASGITransport(app=make_app(path))
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            chunk = 256 * 1024
+            scenarios = (
+                ("full GET", lambda i: {}),
+                ("If-None-Match", lambda i: {"If-None-Match": '"bench"'}),
+                ("Range 256 KB", lambda i: {"Range": f"bytes={i * chunk % FILE_SIZE}-{i * chunk % FILE_SIZE + chunk - 1}"}),
+            )
+            print(f"{FILE_SIZE // (1024 * 1024)} MB file, {REQUESTS} requests per scenario")
+            print(f"{'scenario':>14} {'p50 ms':>8} {'KB/request':>11}")
+            for name, headers in scenarios:
+                p50, per_request = await scenario(client, headers)
+                print(f"{name:>14} {p50:>8.2f} {per_request / 1024:>11.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,65 @@
+# python -m benchmarks.media_delivery
+import asyncio
+import os
+import shutil
+import time
+from pathlib import Path as PathLib
+import httpx
+from fastapi import FastAPI, Request
+from media import responses
+from media.MediaInfo import MEDIA_ROOT
+from media.proxy import MediaProxyMiddleware
+
+FILE_SIZE = 8 * 1024 * 1024
+CONCURRENCY = 32
+REQUESTS = 256
+BENCH_DIR = PathLib(MEDIA_ROOT) / "bench_delivery"
+
+
+def make_app(path: PathLib) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/file")
+    async def serve(request: Request):
+        return responses.media_response(request, path, etag="bench", media_type="video/mp4",
+                                        filename="video.mp4", immutable=True)
+
+    return app
+
+
+async def run(app, follow: bool) -> tuple[float, int]:
+    transport = httpx.ASGITransport(app=app)
+    transferred = 0
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", follow_redirects=follow) as client:
+        async def fetch():
+            nonlocal transferred
+            async with semaphore:
+                response = await client.get("/file")
+                transferred += len(response.content)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(fetch() for _ in range(REQUESTS)))
+        return time.perf_counter() - start, transferred
+
+
+async def main():
+    BENCH_DIR.mkdir(parents=True, exist_ok=True)
+    path = BENCH_DIR / "video.mp4"
+    path.write_bytes(os.urandom(FILE_SIZE))
+    try:
+        print(f"{FILE_SIZE // (1024 * 1024)} MB file, {REQUESTS} downloads, {CONCURRENCY} concurrent")
+        print(f"{'mode':>11} {'worker req/s':>13} {'worker MB':>10} {'end-to-end req/s':>17} {'client MB':>10}")
+        for mode in ("python", "x-accel", "x-sendfile", "signed"):
+            responses.MEDIA_DELIVERY = mode
+            app = make_app(path)
+            worker_elapsed, worker_bytes = await run(app, follow=False)
+            total_elapsed, client_bytes = await run(MediaProxyMiddleware(app), follow=True)
+            print(f"{mode:>11} {REQUESTS / worker_elapsed:>13.0f} {worker_bytes / 2 ** 20:>10.0f} "
+                  f"{REQUESTS / total_elapsed:>17.0f} {client_bytes / 2 ** 20:>10.0f}")
+    finally:
+        shutil.rmtree(BENCH_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
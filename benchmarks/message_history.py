@@ -0,0 +1,77 @@
+# python -m benchmarks.message_history
+import asyncio
+import statistics
+import tempfile
+import time
+from sqlalchemy import select, desc, event, insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from databases.databases import Base, UserModel, ChatModel, ChatMember, MessageModel, AttachmentModel
+from chats.messages.messages import load_attachment_ids
+
+MESSAGES = 5000
+LIMITS = (10, 20, 50, 100)
+ROUNDS = 50
+
+
+async def load_attachment_ids_per_message(db, message_ids):
+    attachments = {}
+    for message_id in message_ids:
+        result = await db.execute(select(AttachmentModel).where(AttachmentModel.message_id == message_id))
+        attachments[message_id] = [att.id for att in result.scalars().all()]
+    return attachments
+
+
+async def populate(session_maker):
+    async with session_maker() as db:
+        db.add(UserModel(id=1, name="bench", lastname="bench", hash_pwd="", bio="", email="bench@example.com"))
+        db.add(ChatModel(id=1, is_private=False, name="bench"))
+        await db.flush()
+        db.add(ChatMember(chat_id=1, user_id=1, role="owner"))
+        await db.flush()
+        await db.execute(insert(MessageModel), [
+            {"id": i, "user_id": 1, "chat_id": 1, "text": f"message {i}"} for i in range(1, MESSAGES + 1)
+        ])
+        await db.execute(insert(AttachmentModel), [
+            {"message_id": i, "filename": "a.bin", "filepath": "attachments/a.bin",
+             "content_type": "application/octet-stream", "size": 1}
+            for i in range(1, MESSAGES + 1, 2)
+        ])
+        await db.commit()
+
+
+async def measure(session_maker, loader, limit, counter):
+    timings = []
+    counter[0] = 0
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        async with session_maker() as db:
+            result = await db.execute(select(MessageModel.id).where(MessageModel.chat_id == 1)
+                                      .order_by(desc(MessageModel.id)).limit(limit))
+            await loader(db, result.scalars().all())
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), counter[0] // ROUNDS
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp}/bench.db")
+        counter = [0]
+
+        @event.listens_for(engine.sync_engine, "before_cursor_execute")
+        def count(*args):
+            counter[0] += 1
+
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_maker = async_sessionmaker(engine, expire_on_commit=False)
+        await populate(session_maker)
+        print(f"{'limit':>5} {'per-message ms':>15} {'queries':>8} {'batched ms':>11} {'queries':>8}")
+        for limit in LIMITS:
+            before, before_queries = await measure(session_maker, load_attachment_ids_per_message, limit, counter)
+            after, after_queries = await measure(session_maker, load_attachment_ids, limit, counter)
+            print(f"{limit:>5} {before:>15.2f} {before_queries:>8} {after:>11.2f} {after_queries:>8}")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
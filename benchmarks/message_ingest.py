@@ -0,0 +1,84 @@
+# python -m benchmarks.message_ingest
+import asyncio
+import statistics
+import tempfile
+import time
+from sqlalchemy import insert, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from databases.databases import Base, UserModel, ChatModel, ChatMember, ChatSummary, MessageModel, \
+    create_engine_from_settings
+from chats.ingest import MessageWriter
+from chats.messages import messages
+
+SENDERS = (10, 100, 1_000)
+CHATS = 100
+MESSAGES_PER_RUN = 5_000
+
+
+async def populate(session_maker):
+    users = max(SENDERS)
+    async with session_maker() as db:
+        await db.execute(insert(UserModel), [
+            {"id": i, "name": f"user{i}", "lastname": "bench", "hash_pwd": "", "bio": "", "email": f"user{i}@example.com"}
+            for i in range(1, users + 1)
+        ])
+        await db.execute(insert(ChatModel), [
+            {"id": i, "is_private": False, "name": f"chat{i}", "status": "opened"} for i in range(1, CHATS + 1)
+        ])
+        await db.execute(insert(ChatSummary), [{"chat_id": i, "message_count": 0} for i in range(1, CHATS + 1)])
+        await db.execute(insert(ChatMember), [
+            {"chat_id": i % CHATS + 1, "user_id": i, "role": "member"} for i in range(1, users + 1)
+        ])
+        await db.commit()
+
+
+async def sender(session_maker, user_id: int, count: int, timings: list[float], errors: list[Exception]):
+    for i in range(count):
+        start = time.perf_counter()
+        try:
+            async with session_maker() as db:
+                await messages.send_message(text=f"message {i} from {user_id}", chat_id=user_id % CHATS + 1,
+                                            files=[], user_id=user_id, db=db)
+        except Exception as exc:
+            errors.append(exc)
+            continue
+        timings.append((time.perf_counter() - start) * 1000)
+
+
+async def measure(session_maker, mode: str, senders: int):
+    messages.MESSAGE_INGEST_MODE = mode
+    messages.message_writer = MessageWriter(session_maker)
+    timings, errors = [], []
+    per_sender = max(1, MESSAGES_PER_RUN // senders)
+    start = time.perf_counter()
+    await asyncio.gather(*(sender(session_maker, user_id, per_sender, timings, errors)
+                           for user_id in range(1, senders + 1)))
+    elapsed = time.perf_counter() - start
+    await messages.message_writer.close()
+    timings.sort()
+    p99 = timings[int(len(timings) * 0.99)] if timings else float("nan")
+    p50 = statistics.median(timings) if timings else float("nan")
+    return len(timings) / elapsed, p50, p99, len(errors)
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine_from_settings(f"sqlite+aiosqlite:///{tmp}/bench.db", echo=False)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_maker = async_sessionmaker(engine, expire_on_commit=False)
+        await populate(session_maker)
+        print(f"{'senders':>8} {'mode':>8} {'msg/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for senders in SENDERS:
+            for mode in ("direct", "batched"):
+                rate, p50, p99, errors = await measure(session_maker, mode, senders)
+                print(f"{senders:>8} {mode:>8} {rate:>8.0f} {p50:>8.1f} {p99:>8.1f} {errors:>7}")
+        async with session_maker() as db:
+            stored = (await db.execute(select(func.count()).select_from(MessageModel))).scalar_one()
+            counted = (await db.execute(select(func.sum(ChatSummary.message_count)))).scalar_one()
+        print(f"{stored} messages stored, {counted} counted in chat summaries")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
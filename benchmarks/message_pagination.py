@@ -0,0 +1,77 @@
+# python -m benchmarks.message_pagination [messages]
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from sqlalchemy import select, desc, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from databases.databases import Base, UserModel, ChatModel, ChatMember, MessageModel, create_engine_from_settings
+from chats.messages.messages import get_message
+from chats.cursors import encode_cursor
+
+MESSAGES = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+PAGE = 50
+ROUNDS = 20
+CHUNK = 100_000
+
+
+async def populate(session_maker):
+    async with session_maker() as db:
+        db.add(UserModel(id=1, name="bench", lastname="bench", hash_pwd="", bio="", email="bench@example.com"))
+        db.add(ChatModel(id=1, is_private=False, name="bench"))
+        await db.flush()
+        db.add(ChatMember(chat_id=1, user_id=1, role="owner"))
+        await db.commit()
+        for start in range(1, MESSAGES + 1, CHUNK):
+            await db.execute(insert(MessageModel), [
+                {"user_id": 1, "chat_id": 1, "text": f"message {i}"}
+                for i in range(start, min(start + CHUNK, MESSAGES + 1))
+            ])
+            await db.commit()
+
+
+async def keyset_page(db, cursor):
+    return await get_message(limit=PAGE, before=cursor, after=None, chat_id=1, user_id=1, db=db)
+
+
+async def offset_page(db, offset):
+    result = await db.execute(select(MessageModel).where(MessageModel.chat_id == 1)
+                              .order_by(desc(MessageModel.id)).offset(offset).limit(PAGE))
+    return result.scalars().all()
+
+
+async def timed(session_maker, page, arg):
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        async with session_maker() as db:
+            await page(db, arg)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine_from_settings(f"sqlite+aiosqlite:///{tmp}/bench.db", echo=False)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_maker = async_sessionmaker(engine, expire_on_commit=False)
+        await populate(session_maker)
+        async with session_maker() as db:
+            ids = (await db.execute(select(MessageModel.id).where(MessageModel.chat_id == 1)
+                                    .order_by(desc(MessageModel.id)))).scalars().all()
+        print(f"{len(ids)} messages in chat, page size {PAGE}")
+        print(f"{'depth':>8} {'keyset ms':>10} {'offset ms':>10}")
+        for depth in (0, 1_000, 10_000, 100_000, len(ids) // 2, len(ids) - PAGE):
+            if depth >= len(ids):
+                continue
+            cursor = encode_cursor(ids[depth - 1]) if depth else None
+            keyset = await timed(session_maker, keyset_page, cursor)
+            offset = await timed(session_maker, offset_page, depth)
+            print(f"{depth:>8} {keyset:>10.2f} {offset:>10.2f}")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
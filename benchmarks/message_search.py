@@ -0,0 +1,95 @@
+# python -m benchmarks.message_search [messages]
+import asyncio
+import itertools
+import random
+import statistics
+import sys
+import tempfile
+import time
+from sqlalchemy import select, insert, desc
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from databases.databases import Base, UserModel, ChatModel, ChatMember, MessageModel, messages_fts, \
+    create_engine_from_settings
+from chats.search import search_messages
+
+MESSAGES = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+CHATS = 1_000
+MEMBER_OF = 50
+PAGE = 20
+ROUNDS = 10
+CHUNK = 100_000
+VOCABULARY = [f"word{i}" for i in range(20_000)]
+CUM_WEIGHTS = list(itertools.accumulate(1 / (i + 1) for i in range(len(VOCABULARY))))
+QUERIES = ("word1", "word19999", "word7 word8", "word123", "wor*")
+
+
+def message_text(rng: random.Random) -> str:
+    return " ".join(rng.choices(VOCABULARY, cum_weights=CUM_WEIGHTS, k=12))
+
+
+async def populate(session_maker):
+    rng = random.Random(42)
+    async with session_maker() as db:
+        db.add(UserModel(id=1, name="bench", lastname="bench", hash_pwd="", bio="", email="bench@example.com"))
+        db.add_all(ChatModel(id=chat_id, is_private=False, name="bench") for chat_id in range(1, CHATS + 1))
+        await db.flush()
+        db.add_all(ChatMember(chat_id=chat_id, user_id=1, role="member") for chat_id in range(1, MEMBER_OF + 1))
+        await db.commit()
+        for start in range(1, MESSAGES + 1, CHUNK):
+            rows = [
+                {"id": i, "user_id": 1, "chat_id": rng.randint(1, CHATS), "text": message_text(rng)}
+                for i in range(start, min(start + CHUNK, MESSAGES + 1))
+            ]
+            await db.execute(insert(MessageModel), rows)
+            await db.execute(insert(messages_fts), [{"rowid": row["id"], "text": row["text"]} for row in rows])
+            await db.commit()
+
+
+async def like_search(db, query):
+    chats = select(ChatMember.chat_id).where(ChatMember.user_id == 1)
+    db_request = select(MessageModel.id, MessageModel.text).where(MessageModel.chat_id.in_(chats))
+    for term in query.split():
+        db_request = db_request.where(MessageModel.text.like(f"%{term.rstrip('*')}%"))
+    result = await db.execute(db_request.order_by(desc(MessageModel.id)).limit(PAGE))
+    return result.all()
+
+
+async def ranked_search(db, query):
+    return await search_messages(db, 1, query, PAGE)
+
+
+async def recent_search(db, query):
+    return await search_messages(db, 1, query, PAGE, order="recent")
+
+
+async def timed(session_maker, search, query):
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        async with session_maker() as db:
+            await search(db, query)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine_from_settings(f"sqlite+aiosqlite:///{tmp}/bench.db", echo=False)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_maker = async_sessionmaker(engine, expire_on_commit=False)
+        start = time.perf_counter()
+        await populate(session_maker)
+        print(f"{MESSAGES} messages in {CHATS} chats, member of {MEMBER_OF}, "
+              f"loaded and indexed in {time.perf_counter() - start:.0f} s")
+        print(f"{'query':>12} {'ranked ms':>10} {'recent ms':>10} {'like ms':>8}")
+        for query in QUERIES:
+            ranked = await timed(session_maker, ranked_search, query)
+            recent = await timed(session_maker, recent_search, query)
+            like = await timed(session_maker, like_search, query)
+            print(f"{query:>12} {ranked:>10.2f} {recent:>10.2f} {like:>8.2f}")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
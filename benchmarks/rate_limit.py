@@ -0,0 +1,48 @@
+# python -m benchmarks.rate_limit
+import asyncio
+import random
+import time
+import tracemalloc
+from fastapi import HTTPException, Response
+from auth.ratelimit import RateLimit, MemoryBuckets, hit
+from auth import ratelimit
+
+CALLS = 200_000
+KEYS = (1, 10_000, 1_000_000)
+
+
+async def timed(call, keys: list[int]) -> float:
+    start = time.perf_counter()
+    for key in keys:
+        try:
+            await call(key)
+        except HTTPException:
+            pass
+    return (time.perf_counter() - start) / len(keys) * 1e6
+
+
+async def main():
+    limit = RateLimit("bench", "30/10")
+    rng = random.Random(3)
+    print(f"{'keys':>9} {'take us':>8} {'hit us':>8} {'buckets':>8} {'memory MB':>10} {'sweep ms':>9}")
+    for key_count in KEYS:
+        keys = [rng.randrange(key_count) for _ in range(CALLS)]
+        store = MemoryBuckets()
+        tracemalloc.start()
+        await timed(lambda key: store.take(limit, key), keys)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        store = MemoryBuckets()
+        ratelimit.rate_limit_store = store
+        take_us = await timed(lambda key: store.take(limit, key), keys)
+        response = Response()
+        hit_us = await timed(lambda key: hit(limit, key, response), keys)
+        buckets = len(store.buckets)
+        start = time.perf_counter()
+        store.sweep(time.monotonic() + 60)
+        sweep_ms = (time.perf_counter() - start) * 1000
+        print(f"{key_count:>9} {take_us:>8.2f} {hit_us:>8.2f} {buckets:>8} {memory / 2 ** 20:>10.1f} {sweep_ms:>9.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
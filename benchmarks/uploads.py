@@ -0,0 +1,71 @@
+# python -m benchmarks.uploads
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+import uuid
+from pathlib import Path as PathLib
+from starlette.datastructures import UploadFile
+from media.uploads import store_upload
+
+FILE_SIZE = 20 * 1024 * 1024
+CONCURRENCY = 8
+
+
+async def store_upload_buffered(file, directory, ext=""):
+    filepath = f"{directory}/{uuid.uuid4().hex}{ext}"
+    with open(PathLib("media") / filepath, "wb") as f:
+        f.write(await file.read())
+
+
+def make_uploads(payload):
+    uploads = []
+    for _ in range(CONCURRENCY):
+        spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        spool.write(payload)
+        spool.seek(0)
+        uploads.append(UploadFile(spool, size=len(payload), filename="video.mp4"))
+    return uploads
+
+
+async def loop_lag(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append((time.perf_counter() - start - 0.001) * 1000)
+
+
+async def run(store, payload):
+    uploads = make_uploads(payload)
+    stop = asyncio.Event()
+    lags = []
+    ticker = asyncio.create_task(loop_lag(stop, lags))
+    tracemalloc.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(store(upload, "attachments", ".mp4") for upload in uploads))
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    stop.set()
+    await ticker
+    for upload in uploads:
+        await upload.close()
+    return elapsed, peak, max(lags, default=0.0)
+
+
+async def main():
+    payload = os.urandom(FILE_SIZE)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        PathLib("media/attachments").mkdir(parents=True)
+        print(f"{CONCURRENCY} concurrent uploads of {FILE_SIZE // (1024 * 1024)} MB")
+        print(f"{'mode':>9} {'total s':>8} {'MB/s':>8} {'peak MB':>8} {'max loop lag ms':>16}")
+        for name, store in (("buffered", store_upload_buffered), ("streamed", store_upload)):
+            elapsed, peak, lag = await run(store, payload)
+            throughput = CONCURRENCY * FILE_SIZE / elapsed / (1024 * 1024)
+            print(f"{name:>9} {elapsed:>8.2f} {throughput:>8.1f} {peak / (1024 * 1024):>8.1f} {lag:>16.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
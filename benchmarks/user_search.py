@@ -0,0 +1,83 @@
+# python -m benchmarks.user_search [users]
+import asyncio
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from databases.databases import Base, UserModel, create_engine_from_settings
+from users.directory import UserDirectory, search_users_in_db
+
+USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+CHUNK = 100_000
+ROUNDS = 200
+LIMIT = 20
+FIRST_NAMES = ["Alexander", "Maria", "Ivan", "Anna", "Dmitry", "Elena", "Sergey", "Olga", "Mikhail", "Natalia",
+               "Andrey", "Tatiana", "Pavel", "Irina", "Nikolai", "Svetlana", "Alexey", "Ekaterina", "Artem", "Yulia"]
+SYLLABLES = ["ko", "va", "lev", "sky", "mi", "ro", "nov", "pet", "ste", "ser", "gin", "ba", "tin", "dor", "zu"]
+QUERIES = ("alex", "alexander", "ivan petro", "kovamiro", "elean", "olga@", "user123456@")
+
+
+def lastname(rng: random.Random) -> str:
+    return "".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))).capitalize()
+
+
+async def populate(session_maker):
+    rng = random.Random(7)
+    async with session_maker() as db:
+        for start in range(1, USERS + 1, CHUNK):
+            await db.execute(insert(UserModel), [
+                {"id": i, "name": rng.choice(FIRST_NAMES), "lastname": lastname(rng), "hash_pwd": "", "bio": "",
+                 "email": f"user{i}@example.com"}
+                for i in range(start, min(start + CHUNK, USERS + 1))
+            ])
+            await db.commit()
+
+
+async def timed(search, query):
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        await search(query)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.99)]
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine_from_settings(f"sqlite+aiosqlite:///{tmp}/bench.db", echo=False)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_maker = async_sessionmaker(engine, expire_on_commit=False)
+        await populate(session_maker)
+        directory = UserDirectory()
+        tracemalloc.start()
+        start = time.perf_counter()
+        await directory.load(session_maker)
+        elapsed = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"{USERS} users, index built in {elapsed:.1f} s, {memory / 2 ** 20:.0f} MB")
+
+        async def index_search(query):
+            return directory.search(query, LIMIT)
+
+        async def db_search(query):
+            async with session_maker() as db:
+                return await search_users_in_db(db, query, LIMIT)
+
+        print(f"{'query':>13} {'index p50':>10} {'index p99':>10} {'db p50':>8} {'db p99':>8} {'hits':>5}")
+        for query in QUERIES:
+            index_p50, index_p99 = await timed(index_search, query)
+            db_p50, db_p99 = await timed(db_search, query)
+            hits = len(directory.search(query, LIMIT))
+            print(f"{query:>13} {index_p50:>10.3f} {index_p99:>10.3f} {db_p50:>8.3f} {db_p99:>8.3f} {hits:>5}")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,35 +1,42 @@
-from fastapi import APIRouter, Depends, Path
+import asyncio
+from fastapi import APIRouter, Depends, Path, Query, WebSocket, WebSocketDisconnect
 from fastapi import HTTPException, status
 from pydantic import BaseModel, Field
 from sqlalchemy.ext.asyncio import AsyncSession
-from databases.databases import get_db, UserModel, ChatModel, ChatMember
-from sqlalchemy import select, update, delete
-from typing import List, Set
-from auth.validation import get_current_user
+from databases.databases import get_db, utc_now, UserModel, ChatModel, ChatMember, ChatSummary, DirectChatModel, \
+    MessageModel
+from sqlalchemy import select, insert, update, delete, desc, func, and_, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from typing import List, Literal, Optional, Set
+from auth.validation import get_current_user, verify_token
+from auth.ratelimit import limit_by_user, NEW_CHAT_USER_LIMIT
 from chats.messages.messages import messages_router
+from chats.hub import hub
+from chats.cursors import encode_cursor, decode_cursor
+from chats.summary import create_summary
+from chats.members import ChatAccess, membership
+from chats.receipts import ack_buffer, write_acks
+from chats.search import search_messages
+from datetime import datetime
 chats_router = APIRouter(prefix="/chats", tags=["chats"])
 chats_router.include_router(messages_router)
 
 
+MAX_CHAT_MEMBERS = 10_000
+MAX_ACKS = 500
+
+
 class SetChatSchema(BaseModel):
-    members_id: Set[int] = Field(min_length=2, max_length=15)
+    members_id: Set[int] = Field(min_length=2, max_length=MAX_CHAT_MEMBERS)
     name: None | str = Field(min_length=1, max_length=64)
 
 
-@chats_router.post("")
+@chats_router.post("", dependencies=[Depends(limit_by_user(NEW_CHAT_USER_LIMIT))])
 async def create_chat(schema: SetChatSchema, owner_id: int = Depends(get_current_user),
                       db: AsyncSession = Depends(get_db)):
-    for member in schema.members_id:
-        result = await db.execute(select(UserModel).where(UserModel.id == member))
-        if not result.scalar_one_or_none():
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"User {member} does not exist"
-            )
+    names = await load_user_names(db, schema.members_id | {owner_id})
     if not schema.name:
-        result = await db.execute(select(UserModel.name).where(UserModel.id == owner_id))
-        name = result.scalar_one_or_none()
-        schema.name = name + " chat"
+        schema.name = names[owner_id] + " chat"
     new_chat = ChatModel(
         is_private=False,
         name=schema.name,
@@ -37,34 +44,226 @@ async def create_chat(schema: SetChatSchema, owner_id: int = Depends(get_current
     )
     db.add(new_chat)
     await db.flush()
-    ownership = ChatMember(user_id=owner_id, chat_id=new_chat.id, role="owner")
-    db.add(ownership)
-    for member in schema.members_id:
-        if member == owner_id:
-            continue
-        new_chat_member = ChatMember(user_id=member, chat_id=new_chat.id, role="member")
-        db.add(new_chat_member)
+    create_summary(db, new_chat.id)
+    roles = {member: "owner" if member == owner_id else "member" for member in schema.members_id | {owner_id}}
+    await db.execute(insert(ChatMember), [
+        {"chat_id": new_chat.id, "user_id": member, "role": role} for member, role in roles.items()
+    ])
     await db.commit()
+    membership.chat_created(new_chat.id, False, roles)
+    hub.join(new_chat.id, roles)
     return {"ok": True, "chat_id": new_chat.id}
 
 
+async def load_user_names(db: AsyncSession, user_ids: Set[int]) -> dict[int, str]:
+    result = await db.execute(select(UserModel.id, UserModel.name)
+                              .where(UserModel.id.in_(user_ids), UserModel.deleted_at.is_(None)))
+    names = dict(result.all())
+    missing = sorted(user_ids - names.keys())
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Users {', '.join(map(str, missing))} do not exist"
+        )
+    return names
+
+
+class ChatMembersSchema(BaseModel):
+    user_ids: Set[int] = Field(min_length=1, max_length=MAX_CHAT_MEMBERS)
+
+
+async def get_managed_chat(db: AsyncSession, chat_id: int, user_id: int) -> ChatAccess:
+    chat = await membership.get(db, chat_id)
+    if not chat or chat.is_private or chat.roles.get(user_id, "member") == "member":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Permission denied"
+        )
+    return chat
+
+
+@chats_router.post("/{chat_id}/members")
+async def add_chat_members(schema: ChatMembersSchema, chat_id: int = Path(ge=1),
+                           user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    chat = await get_managed_chat(db, chat_id, user_id)
+    await load_user_names(db, schema.user_ids)
+    current = chat.roles.keys()
+    added = schema.user_ids - current
+    if len(current) + len(added) > MAX_CHAT_MEMBERS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Chat can have at most {MAX_CHAT_MEMBERS} members"
+        )
+    if added:
+        dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+        result = await db.execute(dialect.insert(ChatMember).on_conflict_do_nothing().returning(ChatMember.user_id), [
+            {"chat_id": chat_id, "user_id": member, "role": "member"} for member in added
+        ])
+        inserted = set(result.scalars().all())
+        await db.commit()
+        if inserted != added:
+            membership.invalidate(chat_id)
+        membership.members_added(chat_id, inserted)
+        hub.join(chat_id, inserted)
+        added = inserted
+    return {"ok": True, "added": sorted(added)}
+
+
+@chats_router.delete("/{chat_id}/members")
+async def remove_chat_members(schema: ChatMembersSchema, chat_id: int = Path(ge=1),
+                              user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    chat = await get_managed_chat(db, chat_id, user_id)
+    removable = ["member"] if chat.roles[user_id] == "admin" else ["member", "admin"]
+    result = await db.execute(delete(ChatMember)
+                              .where(ChatMember.chat_id == chat_id, ChatMember.user_id.in_(schema.user_ids),
+                                     ChatMember.role.in_(removable))
+                              .returning(ChatMember.user_id))
+    removed = result.scalars().all()
+    await db.commit()
+    membership.members_removed(chat_id, removed)
+    hub.leave(chat_id, set(removed))
+    return {"ok": True, "removed": sorted(removed)}
+
+
+@chats_router.websocket("/ws")
+async def chat_events(websocket: WebSocket, token: str = Query(), db: AsyncSession = Depends(get_db)):
+    try:
+        user_id = await verify_token(token, db)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    result = await db.execute(select(ChatMember.chat_id).where(ChatMember.user_id == user_id))
+    chat_ids = result.scalars().all()
+    await db.close()
+    await websocket.accept()
+    conn = hub.connect(websocket, user_id, chat_ids)
+    sender = asyncio.create_task(hub.pump(conn))
+    receiver = asyncio.create_task(_drain_client(websocket))
+    try:
+        await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        sender.cancel()
+        receiver.cancel()
+        hub.disconnect(conn)
+
+
+async def _drain_client(websocket: WebSocket):
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+
+
 @chats_router.get("")
-async def load_all_chats(user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
-    result = await db.execute(
-        select(ChatMember.chat_id, ChatModel.name, ChatModel.is_private)
-        .join(ChatModel, ChatMember.chat_id == ChatModel.id)
+async def load_all_chats(limit: int = Query(50, ge=1, le=200), cursor: Optional[str] = None,
+                         user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    page = (
+        select(ChatMember.chat_id, ChatMember.last_read_message_id, ChatSummary.last_message_id,
+               ChatSummary.last_user_id, ChatSummary.last_text, ChatSummary.last_activity_at,
+               ChatSummary.message_count)
+        .join(ChatSummary, ChatSummary.chat_id == ChatMember.chat_id)
         .where(ChatMember.user_id == user_id)
     )
+    if cursor is not None:
+        activity_at, chat_id = decode_cursor(cursor, datetime.fromisoformat, int)
+        page = page.where(or_(ChatSummary.last_activity_at < activity_at,
+                              and_(ChatSummary.last_activity_at == activity_at, ChatMember.chat_id < chat_id)))
+    page = page.order_by(desc(ChatSummary.last_activity_at), desc(ChatMember.chat_id)).limit(limit + 1).subquery()
+    unread = (
+        select(func.count(MessageModel.id))
+        .where(MessageModel.chat_id == page.c.chat_id, MessageModel.deleted_at.is_(None),
+               MessageModel.id > page.c.last_read_message_id)
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        select(page, ChatModel.name, ChatModel.is_private, unread.label("unread_count"))
+        .join(ChatModel, ChatModel.id == page.c.chat_id)
+        .order_by(desc(page.c.last_activity_at), desc(page.c.chat_id))
+    )
+    rows = result.all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].last_activity_at.isoformat(), rows[-1].chat_id)
     loaded_chats = [
-        {"chat_id": row[0], "chat_name": row[1], "is_private": row[2]}
-        for row in result.all()
+        {
+            "chat_id": row.chat_id,
+            "chat_name": row.name,
+            "is_private": row.is_private,
+            "last_message": {
+                "message_id": row.last_message_id,
+                "user_id": row.last_user_id,
+                "text": row.last_text,
+                "sent_at": row.last_activity_at
+            } if row.last_message_id else None,
+            "message_count": row.message_count,
+            "unread_count": row.unread_count
+        }
+        for row in rows
     ]
     return {
         "ok": True,
-        "chat_list": loaded_chats
+        "chat_list": loaded_chats,
+        "next_cursor": next_cursor
     }
 
 
+@chats_router.get("/search")
+async def search_chat_messages(q: str = Query(min_length=1, max_length=200), chat_id: Optional[int] = Query(None, ge=1),
+                               order: Literal["rank", "recent"] = "rank", limit: int = Query(20, ge=1, le=100),
+                               cursor: Optional[str] = None, user_id: int = Depends(get_current_user),
+                               db: AsyncSession = Depends(get_db)):
+    result = await search_messages(db, user_id, q, limit, cursor, chat_id, order)
+    return {"ok": True, **result}
+
+
+class ReadChatSchema(BaseModel):
+    message_id: int = Field(ge=1)
+
+
+@chats_router.post("/{chat_id}/read")
+async def mark_chat_read(schema: ReadChatSchema, chat_id: int = Path(ge=1), user_id: int = Depends(get_current_user),
+                         db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(ChatSummary.last_message_id)
+                              .join(ChatMember, ChatMember.chat_id == ChatSummary.chat_id)
+                              .where(ChatSummary.chat_id == chat_id, ChatMember.user_id == user_id))
+    row = result.one_or_none()
+    if not row:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No chat found or you are not a member"
+        )
+    message_id = min(schema.message_id, row.last_message_id or 0)
+    await write_acks(db, {(chat_id, user_id): (message_id, message_id)})
+    await db.commit()
+    return {"ok": True, "last_read_message_id": message_id}
+
+
+class AckSchema(BaseModel):
+    chat_id: int = Field(ge=1)
+    read_message_id: int = Field(0, ge=0)
+    delivered_message_id: int = Field(0, ge=0)
+
+
+class AcksSchema(BaseModel):
+    acks: List[AckSchema] = Field(min_length=1, max_length=MAX_ACKS)
+
+
+@chats_router.post("/acks", status_code=status.HTTP_202_ACCEPTED)
+async def acknowledge_messages(schema: AcksSchema, user_id: int = Depends(get_current_user),
+                               db: AsyncSession = Depends(get_db)):
+    for ack in schema.acks:
+        if not await membership.role(db, ack.chat_id, user_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"No chat {ack.chat_id} found or you are not a member"
+            )
+    for ack in schema.acks:
+        ack_buffer.ack(ack.chat_id, user_id, ack.read_message_id, ack.delivered_message_id)
+    return {"ok": True, "accepted": len(schema.acks)}
+
+
 class PatchChatSchema(BaseModel):
     name: None | str = Field(min_length=1, max_length=64)
 
@@ -73,18 +272,14 @@ class PatchChatSchema(BaseModel):
 async def change_chat_settings(schema: PatchChatSchema, user_id: int = Depends(get_current_user),
                                chat_id: int = Path(ge=1, description="id must be positive"),
                                db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(ChatModel).join(ChatMember, ChatMember.chat_id == ChatModel.id)
-                              .where(ChatModel.id == chat_id, ChatMember.user_id == user_id,
-                                     ChatMember.role != "member"))
-    data = result.scalar_one_or_none()
-    if not data:
+    if await membership.role(db, chat_id, user_id) in (None, "member"):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Permission denied"
         )
 
     if schema.name:
-        data.name = schema.name
+        await db.execute(update(ChatModel).where(ChatModel.id == chat_id).values(name=schema.name))
 
     await db.commit()
     return {"ok": True}
@@ -98,11 +293,8 @@ class ChangeRole(BaseModel):
 async def change_role(schema: ChangeRole, owner_id: int = Depends(get_current_user), chat_id: int = Path(ge=1),
                       user_id: int = Path(ge=1),
                       db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(ChatMember)
-                              .where(ChatMember.user_id == owner_id,
-                                     ChatMember.chat_id == chat_id, ChatMember.role == "owner"))
-    data = result.scalar_one_or_none()
-    if not data:
+    chat = await membership.get(db, chat_id)
+    if not chat or chat.roles.get(owner_id) != "owner":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Permission denied"
@@ -112,30 +304,31 @@ async def change_role(schema: ChangeRole, owner_id: int = Depends(get_current_us
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Сan not make the owner an admin"
         )
-    result = await db.execute(select(ChatMember).where(ChatMember.user_id == user_id, ChatMember.chat_id == chat_id))
-    if not result.scalar_one_or_none():
+    if user_id not in chat.roles:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not in chat"
         )
+    role = "admin" if schema.is_admin else "member"
     await db.execute(update(ChatMember).where(ChatMember.user_id == user_id, ChatMember.chat_id == chat_id)
-                     .values(role="admin" if schema.is_admin else "member"))
+                     .values(role=role))
     await db.commit()
+    membership.role_changed(chat_id, user_id, role)
     return {"ok": True}
 
 
 @chats_router.delete("/{chat_id}")
 async def delete_chat(owner_id: int = Depends(get_current_user),
                       chat_id: int = Path(ge=1), db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(ChatMember)
-                              .where(ChatMember.user_id == owner_id,
-                                     ChatMember.chat_id == chat_id, ChatMember.role == "owner"))
-    data = result.scalar_one_or_none()
-    if not data:
+    if await membership.role(db, chat_id, owner_id) != "owner":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Permission denied"
         )
-    await db.execute(delete(ChatModel).where(ChatModel.id == chat_id))
+    await db.execute(update(ChatModel).where(ChatModel.id == chat_id).values(deleted_at=utc_now()))
+    await db.execute(delete(ChatMember).where(ChatMember.chat_id == chat_id))
+    await db.execute(delete(DirectChatModel).where(DirectChatModel.chat_id == chat_id))
     await db.commit()
+    membership.chat_deleted(chat_id)
+    hub.leave(chat_id)
     return {"ok": True}
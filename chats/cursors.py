@@ -0,0 +1,21 @@
+import base64
+import binascii
+from fastapi import HTTPException, status
+
+
+def encode_cursor(*values) -> str:
+    raw = ",".join(str(value) for value in values)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *types) -> tuple:
+    try:
+        parts = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split(",")
+        if len(parts) != len(types):
+            raise ValueError(cursor)
+        return tuple(cast(part) for cast, part in zip(types, parts))
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
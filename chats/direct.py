@@ -0,0 +1,39 @@
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from databases.databases import ChatModel, ChatMember, DirectChatModel
+from chats.hub import hub
+from chats.members import membership
+from chats.summary import create_summary
+
+
+def ordered_pair(user_id: int, user2_id: int) -> tuple[int, int]:
+    return min(user_id, user2_id), max(user_id, user2_id)
+
+
+async def find_direct_chat(db: AsyncSession, user_id: int, user2_id: int) -> int | None:
+    min_user_id, max_user_id = ordered_pair(user_id, user2_id)
+    result = await db.execute(select(DirectChatModel.chat_id).where(DirectChatModel.min_user_id == min_user_id,
+                                                                    DirectChatModel.max_user_id == max_user_id))
+    return result.scalar_one_or_none()
+
+
+async def create_direct_chat(db: AsyncSession, user_id: int, user2_id: int) -> int:
+    min_user_id, max_user_id = ordered_pair(user_id, user2_id)
+    new_chat = ChatModel(is_private=True, name=None, status="opened")
+    db.add(new_chat)
+    await db.flush()
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    result = await db.execute(dialect.insert(DirectChatModel)
+                              .values(min_user_id=min_user_id, max_user_id=max_user_id, chat_id=new_chat.id)
+                              .on_conflict_do_nothing()
+                              .returning(DirectChatModel.chat_id))
+    if result.scalar_one_or_none() is None:
+        await db.rollback()
+        return await find_direct_chat(db, user_id, user2_id)
+    create_summary(db, new_chat.id)
+    db.add_all([ChatMember(chat_id=new_chat.id, user_id=member, role="member") for member in (user_id, user2_id)])
+    await db.commit()
+    membership.chat_created(new_chat.id, True, {user_id: "member", user2_id: "member"})
+    hub.join(new_chat.id, (user_id, user2_id))
+    return new_chat.id
@@ -0,0 +1,103 @@
+import asyncio
+import json
+from fastapi import WebSocket
+from fastapi.encoders import jsonable_encoder
+
+QUEUE_SIZE = 256
+EVICTED_CLOSE_CODE = 4008
+
+
+class Connection:
+    def __init__(self, websocket: WebSocket, user_id: int, queue_size: int = QUEUE_SIZE):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.queue: asyncio.Queue[str | None] = asyncio.Queue(maxsize=queue_size)
+        self.chat_ids: set[int] = set()
+
+
+class ChatHub:
+    def __init__(self, queue_size: int = QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.chats: dict[int, set[Connection]] = {}
+        self.users: dict[int, set[Connection]] = {}
+
+    def connect(self, websocket: WebSocket, user_id: int, chat_ids) -> Connection:
+        conn = Connection(websocket, user_id, self.queue_size)
+        self.users.setdefault(user_id, set()).add(conn)
+        for chat_id in chat_ids:
+            self._subscribe(conn, chat_id)
+        return conn
+
+    def disconnect(self, conn: Connection):
+        for chat_id in conn.chat_ids:
+            subscribers = self.chats.get(chat_id)
+            if subscribers is not None:
+                subscribers.discard(conn)
+                if not subscribers:
+                    del self.chats[chat_id]
+        conn.chat_ids.clear()
+        connections = self.users.get(conn.user_id)
+        if connections is not None:
+            connections.discard(conn)
+            if not connections:
+                del self.users[conn.user_id]
+
+    def join(self, chat_id: int, user_ids):
+        for user_id in user_ids:
+            for conn in self.users.get(user_id, ()):
+                self._subscribe(conn, chat_id)
+
+    def leave(self, chat_id: int, user_ids=None):
+        subscribers = self.chats.get(chat_id)
+        if not subscribers:
+            return
+        for conn in list(subscribers):
+            if user_ids is None or conn.user_id in user_ids:
+                subscribers.discard(conn)
+                conn.chat_ids.discard(chat_id)
+        if not subscribers:
+            del self.chats[chat_id]
+
+    def publish(self, chat_id: int, event: dict):
+        subscribers = self.chats.get(chat_id)
+        if not subscribers:
+            return
+        payload = json.dumps(jsonable_encoder(event))
+        for conn in list(subscribers):
+            try:
+                conn.queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                self.evict(conn)
+
+    def evict(self, conn: Connection):
+        self.disconnect(conn)
+        while not conn.queue.empty():
+            conn.queue.get_nowait()
+        conn.queue.put_nowait(None)
+
+    async def pump(self, conn: Connection):
+        while True:
+            payload = await conn.queue.get()
+            if payload is None:
+                await conn.websocket.close(code=EVICTED_CLOSE_CODE, reason="Too slow, reconnect")
+                return
+            await conn.websocket.send_text(payload)
+
+    def _subscribe(self, conn: Connection, chat_id: int):
+        self.chats.setdefault(chat_id, set()).add(conn)
+        conn.chat_ids.add(chat_id)
+
+
+hub = ChatHub()
+
+
+def message_event(message, attachment_ids) -> dict:
+    return {
+        "type": "message",
+        "message_id": message.id,
+        "user_id": message.user_id,
+        "chat_id": message.chat_id,
+        "text": message.text,
+        "sent_at": message.sent_at,
+        "attachment_ids": attachment_ids
+    }
@@ -0,0 +1,133 @@
+import asyncio
+import os
+from dataclasses import dataclass, field
+from fastapi import UploadFile
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from databases.databases import AsyncSessionLocal, MessageModel, AttachmentModel, utc_now
+from chats.summary import record_messages
+from chats.outbox import enqueue_many
+from media.blobs import acquire_blob
+from media.uploads import StoredFile
+
+MESSAGE_INGEST_MODE = os.getenv("MESSAGE_INGEST_MODE", "direct")
+INGEST_MAX_DELAY_MS = float(os.getenv("INGEST_MAX_DELAY_MS", "3"))
+INGEST_MAX_BATCH = int(os.getenv("INGEST_MAX_BATCH", "500"))
+
+
+@dataclass
+class PendingAttachment:
+    filename: str
+    content_type: str
+    stored: StoredFile
+    upload: UploadFile | None = None
+
+
+@dataclass
+class PendingMessage:
+    user_id: int
+    chat_id: int
+    text: str
+    attachments: list[PendingAttachment]
+    future: asyncio.Future
+    message: MessageModel | None = None
+    attachment_ids: list[int] = field(default_factory=list)
+
+
+class MessageWriter:
+    def __init__(self, session_maker=AsyncSessionLocal):
+        self.session_maker = session_maker
+        self.queue: asyncio.Queue[PendingMessage] | None = None
+        self.task: asyncio.Task | None = None
+        self.batch: list[PendingMessage] = []
+
+    async def submit(self, user_id: int, chat_id: int, text: str,
+                     attachments: list[PendingAttachment]) -> tuple[MessageModel, list[int]]:
+        if self.task is None or self.task.done():
+            self.queue = asyncio.Queue()
+            self.task = asyncio.create_task(self.run())
+        pending = PendingMessage(user_id, chat_id, text, attachments, asyncio.get_running_loop().create_future())
+        self.queue.put_nowait(pending)
+        return await pending.future
+
+    async def close(self):
+        if self.task is None:
+            return
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        self.task = None
+        pending = self.batch
+        while not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+        for message in pending:
+            if not message.future.done():
+                message.future.set_exception(RuntimeError("Message writer is shutting down"))
+        self.batch = []
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self.batch = batch = [await self.queue.get()]
+            deadline = loop.time() + INGEST_MAX_DELAY_MS / 1000
+            while len(batch) < INGEST_MAX_BATCH:
+                if self.queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        async with asyncio.timeout(timeout):
+                            batch.append(await self.queue.get())
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    batch.append(self.queue.get_nowait())
+            await self.commit_batch(batch)
+            self.batch = []
+
+    async def commit_batch(self, batch: list[PendingMessage]):
+        try:
+            async with self.session_maker() as db:
+                await write_messages(db, batch)
+                await db.commit()
+        except Exception as exc:
+            if len(batch) == 1:
+                if not batch[0].future.done():
+                    batch[0].future.set_exception(exc)
+                return
+            for pending in batch:
+                await self.commit_batch([pending])
+            return
+        for pending in batch:
+            if not pending.future.done():
+                pending.future.set_result((pending.message, pending.attachment_ids))
+
+
+async def write_messages(db: AsyncSession, batch: list[PendingMessage]):
+    sent_at = utc_now()
+    result = await db.execute(
+        insert(MessageModel).returning(MessageModel.id, sort_by_parameter_order=True),
+        [{"user_id": p.user_id, "chat_id": p.chat_id, "text": p.text, "sent_at": sent_at} for p in batch]
+    )
+    for pending, message_id in zip(batch, result.scalars().all()):
+        pending.message = MessageModel(id=message_id, user_id=pending.user_id, chat_id=pending.chat_id,
+                                       text=pending.text, sent_at=sent_at)
+        pending.attachment_ids = []
+    await record_messages(db, [pending.message for pending in batch])
+    await enqueue_many(db, "message.sent", [(p.message.id, {"message_id": p.message.id}) for p in batch])
+    rows, owners = [], []
+    for pending in batch:
+        for attachment in pending.attachments:
+            stored = attachment.stored
+            await acquire_blob(db, stored.sha256, stored.filepath, stored.size, file=attachment.upload)
+            rows.append({"message_id": pending.message.id, "filename": attachment.filename,
+                         "filepath": stored.filepath, "content_type": attachment.content_type,
+                         "size": stored.size, "sha256": stored.sha256})
+            owners.append(pending)
+    if rows:
+        result = await db.execute(insert(AttachmentModel).returning(AttachmentModel.id, sort_by_parameter_order=True),
+                                  rows)
+        for pending, attachment_id in zip(owners, result.scalars().all()):
+            pending.attachment_ids.append(attachment_id)
+
+
+message_writer = MessageWriter()
@@ -0,0 +1,87 @@
+import os
+from dataclasses import dataclass
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from auth.cache import TTLCache
+from databases.databases import ChatModel, ChatMember
+
+MEMBERSHIP_CACHE_SIZE = int(os.getenv("MEMBERSHIP_CACHE_SIZE", "10000"))
+MEMBERSHIP_CACHE_TTL_SECONDS = float(os.getenv("MEMBERSHIP_CACHE_TTL_SECONDS", "300"))
+
+
+@dataclass
+class ChatAccess:
+    is_private: bool
+    status: str
+    roles: dict[int, str]
+
+
+class Membership:
+    def __init__(self, maxsize: int = MEMBERSHIP_CACHE_SIZE, ttl: float = MEMBERSHIP_CACHE_TTL_SECONDS):
+        # chat id -> ChatAccess
+        self.cache = TTLCache(maxsize, ttl)
+        self.listeners = []
+        self._changes = 0
+
+    def on_change(self, listener):
+        self.listeners.append(listener)
+        return listener
+
+    async def get(self, db: AsyncSession, chat_id: int) -> ChatAccess | None:
+        access = self.cache.get(chat_id)
+        if access is not None:
+            return access
+        changes = self._changes
+        result = await db.execute(select(ChatModel.is_private, ChatModel.status)
+                                  .where(ChatModel.id == chat_id, ChatModel.deleted_at.is_(None)))
+        chat = result.one_or_none()
+        if chat is None:
+            return None
+        result = await db.execute(select(ChatMember.user_id, ChatMember.role).where(ChatMember.chat_id == chat_id))
+        access = ChatAccess(chat.is_private, chat.status, dict(result.all()))
+        if changes == self._changes:
+            self.cache.set(chat_id, access)
+        return access
+
+    async def role(self, db: AsyncSession, chat_id: int, user_id: int) -> str | None:
+        access = await self.get(db, chat_id)
+        return access.roles.get(user_id) if access is not None else None
+
+    def chat_created(self, chat_id: int, is_private: bool, roles: dict[int, str], status: str = "opened"):
+        self.cache.set(chat_id, ChatAccess(is_private, status, dict(roles)))
+        self._changed(chat_id)
+
+    def members_added(self, chat_id: int, user_ids, role: str = "member"):
+        access = self.cache.get(chat_id)
+        if access is not None:
+            access.roles.update(dict.fromkeys(user_ids, role))
+        self._changed(chat_id)
+
+    def members_removed(self, chat_id: int, user_ids):
+        access = self.cache.get(chat_id)
+        if access is not None:
+            for user_id in user_ids:
+                access.roles.pop(user_id, None)
+        self._changed(chat_id)
+
+    def role_changed(self, chat_id: int, user_id: int, role: str):
+        access = self.cache.get(chat_id)
+        if access is not None and user_id in access.roles:
+            access.roles[user_id] = role
+        self._changed(chat_id)
+
+    def chat_deleted(self, chat_id: int):
+        self.cache.invalidate(chat_id)
+        self._changed(chat_id)
+
+    def invalidate(self, chat_id: int):
+        self._changes += 1
+        self.cache.invalidate(chat_id)
+
+    def _changed(self, chat_id: int):
+        self._changes += 1
+        for listener in self.listeners:
+            listener(chat_id)
+
+
+membership = Membership()
@@ -1,18 +1,28 @@
-import uuid
 from datetime import datetime
-from typing import Optional
-from fastapi.responses import FileResponse
-from fastapi import APIRouter, Depends, Path, UploadFile, File, Form, Query
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, Path, UploadFile, File, Form, Query, Request, Response
 from fastapi import HTTPException, status
 from pydantic import BaseModel, Field
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc, delete, update
-from databases.databases import get_db, ChatModel, ChatMember, MessageModel, AttachmentModel
+from sqlalchemy import select, desc, update
+from databases.databases import get_db, utc_now, ChatSummary, MessageModel, MessageRevisionModel, AttachmentModel
 from auth.validation import get_current_user
+from auth.ratelimit import hit, limit_by_user, SEND_MESSAGE_USER_LIMIT, SEND_MESSAGE_CHAT_LIMIT
+from chats.hub import hub, message_event
+from chats.cursors import encode_cursor, decode_cursor
+from chats.summary import record_message, record_edit, record_delete, next_edit_seq
+from chats.members import membership
+from chats.receipts import load_receipts, seen_by
+from chats.revisions import make_delta, load_versions
+from chats.outbox import enqueue
+from chats.ingest import MESSAGE_INGEST_MODE, PendingAttachment, message_writer
 from pathlib import Path as PathLib
 messages_router = APIRouter(prefix="/{chat_id}/messages", tags=["messages"])
 from media.MediaInfo import MAX_FILE_SIZE, MAX_TOTAL_SIZE, ALLOWED_CONTENT_TYPES
 from media.MediaInfo import MEDIA_ROOT
+from media.uploads import StoredFile
+from media.responses import media_response
+from media.blobs import acquire_blob, write_blob
 
 class PatchMessageSchema(BaseModel):
     text: str = Field(min_length=1)
@@ -22,16 +32,35 @@ class PatchMessageSchema(BaseModel):
 async def patch_message(schema: PatchMessageSchema, message_id: int = Path(ge=1), chat_id: int = Path(ge=1),
                         user_id: int = Depends(get_current_user),
                         db: AsyncSession = Depends(get_db)):
-    result = await db.execute(update(MessageModel).where(
-        MessageModel.user_id == user_id, MessageModel.chat_id == chat_id, MessageModel.id == message_id).values(
-        text=schema.text))
-    if result.rowcount == 0:
+    result = await db.execute(select(MessageModel).where(
+        MessageModel.user_id == user_id, MessageModel.chat_id == chat_id, MessageModel.id == message_id,
+        MessageModel.deleted_at.is_(None)))
+    message = result.scalar_one_or_none()
+    if message is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Message not found or you don't have permission"
         )
+    if message.text == schema.text:
+        return {"ok": True, "version": message.version, "edited_at": message.edited_at}
+    revision = MessageRevisionModel(message_id=message_id, version=message.version,
+                                    created_at=message.edited_at or message.sent_at,
+                                    delta=make_delta(schema.text, message.text))
+    version, edited_at = message.version + 1, utc_now()
+    result = await db.execute(update(MessageModel).where(MessageModel.id == message_id,
+                                                         MessageModel.version == revision.version)
+                              .values(text=schema.text, version=version, edited_at=edited_at,
+                                      edit_seq=await next_edit_seq(db, chat_id)))
+    if result.rowcount == 0:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Message was edited concurrently"
+        )
+    db.add(revision)
+    await record_edit(db, chat_id, message_id, schema.text)
+    await enqueue(db, "message.edited", f"{message_id}:{version}", {"message_id": message_id})
     await db.commit()
-    return {"ok": True}
+    return {"ok": True, "version": version, "edited_at": edited_at}
 
 
 # class DeleteMessageSchema(BaseModel):
@@ -42,116 +71,247 @@ async def patch_message(schema: PatchMessageSchema, message_id: int = Path(ge=1)
 async def delete_message(message_id: int = Path(ge=1), chat_id: int = Path(ge=1),
                          user_id: int = Depends(get_current_user),
                          db: AsyncSession = Depends(get_db)):
-    result = await db.execute(delete(MessageModel).where(MessageModel.chat_id == chat_id,
+    result = await db.execute(update(MessageModel).where(MessageModel.chat_id == chat_id,
                                                          MessageModel.user_id == user_id,
-                                                         MessageModel.id == message_id))
+                                                         MessageModel.id == message_id,
+                                                         MessageModel.deleted_at.is_(None))
+                              .values(deleted_at=utc_now(), edit_seq=await next_edit_seq(db, chat_id)))
     if result.rowcount == 0:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Message not found or you don't have permission"
         )
+    await record_delete(db, chat_id, message_id)
+    await enqueue(db, "message.deleted", message_id, {"message_id": message_id})
     await db.commit()
     return {"ok": True}
 
 
+@messages_router.get("/{message_id}/seen")
+async def get_message_seen(message_id: int = Path(ge=1), chat_id: int = Path(ge=1),
+                           state: Literal["read", "delivered"] = "read", limit: int = Query(50, ge=1, le=200),
+                           cursor: Optional[str] = None, user_id: int = Depends(get_current_user),
+                           db: AsyncSession = Depends(get_db)):
+    if not await membership.role(db, chat_id, user_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No chat found or you are not a member"
+        )
+    result = await db.execute(select(MessageModel.user_id).where(MessageModel.chat_id == chat_id,
+                                                                 MessageModel.id == message_id,
+                                                                 MessageModel.deleted_at.is_(None)))
+    sender_id = result.scalar_one_or_none()
+    if sender_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Message not found"
+        )
+    return {"ok": True, **await seen_by(db, chat_id, message_id, sender_id, state, limit, cursor)}
+
+
 @messages_router.get("/{message_id}/attachments/{attachment_id}")
 async def download_attachment(
+    request: Request,
     attachment_id: int = Path(ge=1),
     message_id: int = Path(ge=1),
     user_id: int = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    stmt = (select(AttachmentModel).join(MessageModel, MessageModel.id == AttachmentModel.message_id)
-            .join(ChatMember, ChatMember.chat_id == MessageModel.chat_id)
-            .where(AttachmentModel.id == attachment_id, ChatMember.user_id == user_id, AttachmentModel.message_id == message_id))
-    result = (await db.execute(stmt)).scalar_one_or_none()
-    if not result:
-        raise HTTPException (
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Not allowed or does not exist"
-        )
-    file_path = PathLib(MEDIA_ROOT) / result.filepath
-    if not file_path.is_file():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File missing")
-    return FileResponse(
-            path=file_path,
-            filename=result.filename,
-            media_type=result.content_type or "application/octet-stream"
-    )
+    attachment, sent_at = await load_attachment(db, attachment_id, message_id, user_id)
+    return attachment_response(request, attachment, sent_at, inline=False)
 
 
 @messages_router.get("/{message_id}/attachments/{attachment_id}/view")
 async def view_attachment(
+    request: Request,
     attachment_id: int = Path(ge=1),
     message_id: int = Path(ge=1),
     user_id: int = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    stmt = (
-        select(AttachmentModel)
-        .join(MessageModel, MessageModel.id == AttachmentModel.message_id)
-        .join(ChatMember, ChatMember.chat_id == MessageModel.chat_id)
-        .where(
-            AttachmentModel.id == attachment_id,
-            ChatMember.user_id == user_id, AttachmentModel.message_id == message_id
+    attachment, sent_at = await load_attachment(db, attachment_id, message_id, user_id)
+    return attachment_response(request, attachment, sent_at, inline=True)
+
+
+async def load_attachment(db: AsyncSession, attachment_id: int, message_id: int,
+                          user_id: int) -> tuple[AttachmentModel, datetime]:
+    result = await db.execute(select(AttachmentModel, MessageModel.chat_id, MessageModel.sent_at)
+                              .join(MessageModel, MessageModel.id == AttachmentModel.message_id)
+                              .where(AttachmentModel.id == attachment_id, AttachmentModel.message_id == message_id,
+                                     MessageModel.deleted_at.is_(None)))
+    row = result.one_or_none()
+    if not row or not await membership.role(db, row.chat_id, user_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Not allowed or does not exist"
         )
+    return row.AttachmentModel, row.sent_at
+
+
+def attachment_response(request: Request, attachment: AttachmentModel, sent_at: datetime, inline: bool):
+    return media_response(
+        request,
+        PathLib(MEDIA_ROOT) / attachment.filepath,
+        etag=attachment.sha256 or f"attachment-{attachment.id}-{attachment.size}",
+        media_type=attachment.content_type or "application/octet-stream",
+        filename=attachment.filename,
+        inline=inline,
+        last_modified=sent_at,
+        immutable=True
     )
-    result = await db.execute(stmt)
-    result = result.scalar_one_or_none()
-    if not result:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not allowed or does not exist")
-    file_path = PathLib("media") / result.filepath
-    if not file_path.is_file():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File missing")
-    return FileResponse(
-        path=file_path,
-        media_type=result.content_type or "application/octet-stream",
-        headers={
-            "Content-Disposition": f'inline; filename="{result.filename}"'
-        }
-    )
+
+
+async def store_attachments(db: AsyncSession, files: list[UploadFile]) -> list[StoredFile]:
+    stored_files = await write_attachments(db, files)
+    for file, stored in zip(files, stored_files):
+        await acquire_blob(db, stored.sha256, stored.filepath, stored.size, file=file)
+    return stored_files
+
+
+async def write_attachments(db: AsyncSession, files: list[UploadFile]) -> list[StoredFile]:
+    stored_files = []
+    total_size = 0
+    for file in files:
+        stored = await write_blob(db, file, min(MAX_FILE_SIZE, MAX_TOTAL_SIZE - total_size))
+        stored_files.append(stored)
+        total_size += stored.size
+    return stored_files
+
+
+async def load_attachment_ids(db: AsyncSession, message_ids: list[int]) -> dict[int, list[int]]:
+    attachments = {message_id: [] for message_id in message_ids}
+    if not attachments:
+        return attachments
+    result = await db.execute(select(AttachmentModel.message_id, AttachmentModel.id)
+                              .where(AttachmentModel.message_id.in_(message_ids))
+                              .order_by(AttachmentModel.id))
+    for message_id, attachment_id in result.all():
+        attachments[message_id].append(attachment_id)
+    return attachments
 
 
 @messages_router.get("")
-async def get_message(limit: int = Query(20, ge=1, le=100), before: Optional[float] = None,
+async def get_message(limit: int = Query(20, ge=1, le=100), before: Optional[str] = None,
+                      after: Optional[str] = None, receipts: bool = False,
                       chat_id: int = Path(ge=1), user_id: int = Depends(get_current_user),
                       db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(ChatMember).where(
-        ChatMember.chat_id == chat_id,
-        ChatMember.user_id == user_id))
-    if not result.scalar_one_or_none():
+    if before is not None and after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use either before or after, not both"
+        )
+    if not await membership.role(db, chat_id, user_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="No chat found or you are not a member"
         )
-    db_request = select(MessageModel).where(MessageModel.chat_id == chat_id)
-    if before is not None:
-        db_request = db_request.where(MessageModel.sent_at < datetime.fromtimestamp(before))
-    db_request = db_request.order_by(desc(MessageModel.sent_at)).limit(limit)
-    result = await db.execute(db_request)
+    result = await db.execute(select(ChatSummary.edit_seq).where(ChatSummary.chat_id == chat_id))
+    edit_seq = result.scalar_one_or_none() or 0
+    db_request = select(MessageModel).where(MessageModel.chat_id == chat_id, MessageModel.deleted_at.is_(None))
+    if after is not None:
+        after_id = decode_cursor(after, int)[0]
+        db_request = db_request.where(MessageModel.id > after_id).order_by(MessageModel.id)
+    else:
+        if before is not None:
+            db_request = db_request.where(MessageModel.id < decode_cursor(before, int)[0])
+        db_request = db_request.order_by(desc(MessageModel.id))
+    result = await db.execute(db_request.limit(limit + 1))
     messages = result.scalars().all()
-    response = []
-    for msg in messages:
-        attachments = await db.execute(select(AttachmentModel).where(AttachmentModel.message_id == msg.id))
-        attachments = attachments.scalars().all()
-        response.append(
-            {
-                "message_id": msg.id,
-                "user_id": msg.user_id,
-                "chat_id": msg.chat_id,
-                "text": msg.text,
-                "sent_at": msg.sent_at,
-                "attachment_ids": [att.id for att in attachments]
-            }
-        )
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if after is not None:
+        messages.reverse()
+    attachments = await load_attachment_ids(db, [msg.id for msg in messages])
+    response = [message_payload(msg, attachments[msg.id]) for msg in messages]
+    if receipts:
+        loaded = await load_receipts(db, chat_id, messages)
+        for item in response:
+            item.update(loaded[item["message_id"]])
+    if messages:
+        before_cursor = encode_cursor(messages[-1].id) if has_more or after is not None else None
+        after_cursor = encode_cursor(messages[0].id)
+    else:
+        before_cursor = None
+        after_cursor = after
     return {
         "messages": response,
+        "before_cursor": before_cursor,
+        "after_cursor": after_cursor,
+        "has_more": has_more,
+        "edit_seq": edit_seq,
         "ok": True
     }
 
 
-@messages_router.post("")
+def message_payload(msg: MessageModel, attachment_ids: list[int]) -> dict:
+    return {
+        "message_id": msg.id,
+        "user_id": msg.user_id,
+        "chat_id": msg.chat_id,
+        "text": msg.text,
+        "sent_at": msg.sent_at,
+        "version": msg.version,
+        "edited_at": msg.edited_at,
+        "attachment_ids": attachment_ids
+    }
+
+
+@messages_router.get("/edits")
+async def get_edited_messages(since: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=500),
+                              chat_id: int = Path(ge=1), user_id: int = Depends(get_current_user),
+                              db: AsyncSession = Depends(get_db)):
+    if not await membership.role(db, chat_id, user_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No chat found or you are not a member"
+        )
+    result = await db.execute(select(MessageModel)
+                              .where(MessageModel.chat_id == chat_id, MessageModel.edit_seq > since)
+                              .order_by(MessageModel.edit_seq).limit(limit + 1))
+    messages = result.scalars().all()
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    attachments = await load_attachment_ids(db, [msg.id for msg in messages if msg.deleted_at is None])
+    return {
+        "ok": True,
+        "messages": [message_payload(msg, attachments[msg.id]) for msg in messages if msg.deleted_at is None],
+        "deleted_ids": [msg.id for msg in messages if msg.deleted_at is not None],
+        "edit_seq": messages[-1].edit_seq if messages else since,
+        "has_more": has_more
+    }
+
+
+@messages_router.get("/{message_id}/versions")
+async def get_message_versions(message_id: int = Path(ge=1), chat_id: int = Path(ge=1),
+                               limit: int = Query(20, ge=1, le=100), before: Optional[int] = Query(None, ge=1),
+                               user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    if not await membership.role(db, chat_id, user_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No chat found or you are not a member"
+        )
+    result = await db.execute(select(MessageModel).where(MessageModel.chat_id == chat_id,
+                                                         MessageModel.id == message_id,
+                                                         MessageModel.deleted_at.is_(None)))
+    message = result.scalar_one_or_none()
+    if message is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Message not found"
+        )
+    versions = await load_versions(db, message, message.version + 1 if before is None else before, limit)
+    has_more = bool(versions) and versions[-1]["version"] > 0
+    return {
+        "ok": True,
+        "versions": versions,
+        "before": versions[-1]["version"] if has_more else None,
+        "has_more": has_more
+    }
+
+
+@messages_router.post("", dependencies=[Depends(limit_by_user(SEND_MESSAGE_USER_LIMIT))])
 async def send_message(
+        response: Response,
         text: str = Form(..., min_length=1, max_length=255),
         chat_id: int = Path(ge=1),
         files: list[UploadFile] = File(default=[]),
@@ -160,7 +320,7 @@ async def send_message(
 ):
     total_size = 0
     for file in files:
-        if file.size is None or file.size > MAX_FILE_SIZE:
+        if file.size is not None and file.size > MAX_FILE_SIZE:
             raise HTTPException(
                 status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
                 detail=f"File too large. Max size is {MAX_FILE_SIZE // (1024 * 1024)} MB"
@@ -170,7 +330,7 @@ async def send_message(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="File type not allowed"
             )
-        total_size += file.size
+        total_size += file.size or 0
 
     if total_size > MAX_TOTAL_SIZE:
         raise HTTPException(
@@ -178,47 +338,55 @@ async def send_message(
             detail=f"Total files size too large. Max total size is {MAX_TOTAL_SIZE // (1024 * 1024)} MB"
         )
 
-    result = await db.execute(
-        select(ChatMember).where(
-            ChatMember.chat_id == chat_id,
-            ChatMember.user_id == user_id
-        )
-    )
-    if not result.scalar_one_or_none():
+    chat = await membership.get(db, chat_id)
+    if not chat or user_id not in chat.roles:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You are not in this chat"
         )
-    result = await db.execute(select(ChatModel).where(ChatModel.id == chat_id))
-    chat = result.scalar_one_or_none()
-    if not chat or chat.status != "opened":
+    if chat.status != "opened":
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Chat is closed"
         )
+    await hit(SEND_MESSAGE_CHAT_LIMIT, chat_id, response)
+    new_message, attachment_ids, _ = await post_message(db, user_id, chat_id, text, files)
+    return {"ok": True, "message_id": new_message.id, "uploaded_files": attachment_ids}
+
+
+async def post_message(db: AsyncSession, user_id: int, chat_id: int, text: str,
+                       files: list[UploadFile]) -> tuple[MessageModel, list[int], list[StoredFile]]:
+    if MESSAGE_INGEST_MODE == "batched":
+        stored_files = await write_attachments(db, files)
+        attachments = [
+            PendingAttachment(file.filename or stored.sha256, file.content_type, stored, file)
+            for file, stored in zip(files, stored_files)
+        ]
+        await db.rollback()
+        new_message, attachment_ids = await message_writer.submit(user_id, chat_id, text, attachments)
+        hub.publish(chat_id, message_event(new_message, attachment_ids))
+        return new_message, attachment_ids, stored_files
     new_message = MessageModel(user_id=user_id, chat_id=chat_id, text=text)
     db.add(new_message)
     await db.flush()
+    await record_message(db, new_message)
+    await enqueue(db, "message.sent", new_message.id, {"message_id": new_message.id})
 
-    PathLib("media/attachments").mkdir(parents=True, exist_ok=True)
-    attachment_ids = []
-    for file in files:
-        ext = PathLib(file.filename).suffix.lower() if file.filename else ""
-        unique_filename = f"{uuid.uuid4().hex}{ext}"
-        filepath = f"attachments/{unique_filename}"
-        full_path = PathLib("media") / filepath
-        with open(full_path, "wb") as f:
-            f.write(await file.read())
-        attachment = AttachmentModel(
+    stored_files = await store_attachments(db, files)
+    attachments = [
+        AttachmentModel(
             message_id=new_message.id,
-            filename=file.filename or unique_filename,
-            filepath=filepath,
+            filename=file.filename or stored.sha256,
+            filepath=stored.filepath,
             content_type=file.content_type,
-            size=file.size
+            size=stored.size,
+            sha256=stored.sha256
         )
-        db.add(attachment)
-        await db.flush()
-        attachment_ids.append(attachment.id)
-
+        for file, stored in zip(files, stored_files)
+    ]
+    db.add_all(attachments)
+    await db.flush()
     await db.commit()
-    return {"ok": True, "message_id": new_message.id, "uploaded_files": attachment_ids}
+    attachment_ids = [attachment.id for attachment in attachments]
+    hub.publish(chat_id, message_event(new_message, attachment_ids))
+    return new_message, attachment_ids, stored_files
@@ -0,0 +1,133 @@
+import asyncio
+import os
+from datetime import timedelta
+from sqlalchemy import select, delete, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from databases.databases import AsyncSessionLocal, OutboxModel, utc_now
+
+OUTBOX_WORKER = os.getenv("OUTBOX_WORKER", "1") == "1"
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "200"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "1"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", "2"))
+OUTBOX_RETRY_MAX_SECONDS = float(os.getenv("OUTBOX_RETRY_MAX_SECONDS", "600"))
+
+# topic -> handler name -> async handler(db, payload, idempotency_key)
+handlers: dict[str, dict[str, object]] = {}
+
+
+def outbox_handler(*topics: str, name: str | None = None):
+    def register(func):
+        for topic in topics:
+            handlers.setdefault(topic, {})[name or func.__name__] = func
+        return func
+    return register
+
+
+async def enqueue(db: AsyncSession, topic: str, key, payload: dict):
+    await enqueue_many(db, topic, [(key, payload)])
+
+
+async def enqueue_many(db: AsyncSession, topic: str, events: list[tuple[object, dict]]):
+    rows = [
+        {"topic": topic, "handler": handler, "idempotency_key": f"{topic}:{key}:{handler}", "payload": payload}
+        for key, payload in events
+        for handler in handlers.get(topic, ())
+    ]
+    if not rows:
+        return
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    await db.execute(dialect.insert(OutboxModel).values(rows)
+                     .on_conflict_do_nothing(index_elements=[OutboxModel.idempotency_key]))
+    db.info["outbox_pending"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def wake_outbox_worker(session: Session):
+    if session.info.pop("outbox_pending", False):
+        outbox_worker.wake()
+
+
+def retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1), OUTBOX_RETRY_MAX_SECONDS))
+
+
+async def dispatch(db: AsyncSession, entry: OutboxModel):
+    handler = handlers.get(entry.topic, {}).get(entry.handler)
+    if handler is None:
+        raise LookupError(f"no outbox handler {entry.handler} for {entry.topic}")
+    await handler(db, entry.payload, entry.idempotency_key)
+
+
+class OutboxWorker:
+    def __init__(self):
+        self._wakeup = asyncio.Event()
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def run(self, session_maker=AsyncSessionLocal):
+        while True:
+            self._wakeup.clear()
+            if await self.drain(session_maker) < OUTBOX_BATCH_SIZE:
+                try:
+                    async with asyncio.timeout(OUTBOX_POLL_SECONDS):
+                        await self._wakeup.wait()
+                except asyncio.TimeoutError:
+                    pass
+
+    async def drain(self, session_maker=AsyncSessionLocal) -> int:
+        async with session_maker() as db:
+            result = await db.execute(select(OutboxModel)
+                                      .where(OutboxModel.status == "pending", OutboxModel.available_at <= utc_now())
+                                      .order_by(OutboxModel.id).limit(OUTBOX_BATCH_SIZE)
+                                      .with_for_update(skip_locked=True))
+            entries = result.scalars().all()
+            if not entries:
+                return 0
+            entry_ids = [entry.id for entry in entries]
+            try:
+                for entry in entries:
+                    await dispatch(db, entry)
+                await db.execute(delete(OutboxModel).where(OutboxModel.id.in_(entry_ids)))
+                await db.commit()
+                return len(entry_ids)
+            except Exception:
+                await db.rollback()
+        for entry_id in entry_ids:
+            await self.retry_one(session_maker, entry_id)
+        return len(entry_ids)
+
+    async def retry_one(self, session_maker, entry_id: int):
+        async with session_maker() as db:
+            entry = await db.get(OutboxModel, entry_id, with_for_update={"skip_locked": True})
+            if entry is None or entry.status != "pending":
+                return
+            try:
+                await dispatch(db, entry)
+                await db.delete(entry)
+                await db.commit()
+                return
+            except Exception as exc:
+                await db.rollback()
+                error = repr(exc)[:255]
+            entry = await db.get(OutboxModel, entry_id, populate_existing=True)
+            if entry is None:
+                return
+            entry.attempts += 1
+            entry.last_error = error
+            entry.available_at = utc_now() + retry_delay(entry.attempts)
+            if entry.attempts >= OUTBOX_MAX_ATTEMPTS:
+                entry.status = "failed"
+            await db.commit()
+
+
+outbox_worker = OutboxWorker()
+
+
+if __name__ == "__main__":
+    from chats import search
+    from chats.outbox import outbox_worker as worker
+    asyncio.run(worker.run())
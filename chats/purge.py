@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import os
+from datetime import timedelta
+from sqlalchemy import bindparam, select, delete, exists, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from databases.databases import AsyncSessionLocal, utc_now, AttachmentModel, ChatModel, MessageModel, UserModel
+from chats.search import unindex_messages
+from chats.summary import record_deletes, next_edit_seq
+from chats.outbox import enqueue_many
+from media.blobs import release_blobs, collect_blobs, remove_blobs, remove_blob_files
+
+PURGE_WORKER = os.getenv("PURGE_WORKER", "1") == "1"
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "500"))
+PURGE_PAUSE_MS = float(os.getenv("PURGE_PAUSE_MS", "50"))
+PURGE_POLL_SECONDS = float(os.getenv("PURGE_POLL_SECONDS", "5"))
+PURGE_MIN_AGE_SECONDS = int(os.getenv("PURGE_MIN_AGE_SECONDS", str(7 * 24 * 60 * 60)))
+
+logger = logging.getLogger(__name__)
+
+
+async def purge_messages(db: AsyncSession, where) -> tuple[int, list[str], list[str]]:
+    result = await db.execute(select(MessageModel.id).where(where).order_by(MessageModel.id).limit(PURGE_BATCH_SIZE))
+    message_ids = result.scalars().all()
+    if not message_ids:
+        return 0, [], []
+    released = await release_blobs(db, message_ids)
+    result = await db.execute(select(AttachmentModel.filepath)
+                              .where(AttachmentModel.message_id.in_(message_ids), AttachmentModel.sha256.is_(None)))
+    files = result.scalars().all()
+    await unindex_messages(db, message_ids)
+    await db.execute(delete(MessageModel).where(MessageModel.id.in_(message_ids)))
+    return len(message_ids), files, await collect_blobs(db, released)
+
+
+async def tombstone_messages(db: AsyncSession, where) -> int:
+    result = await db.execute(select(MessageModel.id, MessageModel.chat_id)
+                              .where(where, MessageModel.deleted_at.is_(None))
+                              .order_by(MessageModel.id).limit(PURGE_BATCH_SIZE))
+    rows = result.all()
+    if not rows:
+        return 0
+    deleted: dict[int, list[int]] = {}
+    for row in rows:
+        deleted.setdefault(row.chat_id, []).append(row.id)
+    params = []
+    for chat_id, message_ids in deleted.items():
+        edit_seq = await next_edit_seq(db, chat_id, len(message_ids)) - len(message_ids)
+        params.extend({"b_id": message_id, "b_edit_seq": edit_seq + i} for i, message_id in enumerate(message_ids, 1))
+    messages = MessageModel.__table__
+    await db.execute(update(messages).where(messages.c.id == bindparam("b_id"))
+                     .values(deleted_at=utc_now(), edit_seq=bindparam("b_edit_seq")), params)
+    await record_deletes(db, deleted)
+    await enqueue_many(db, "message.deleted", [(row.id, {"message_id": row.id}) for row in rows])
+    return len(rows)
+
+
+async def purge_batch(db: AsyncSession) -> tuple[int, list[str], list[str]]:
+    purged, files, blobs = await purge_messages(
+        db, MessageModel.deleted_at < utc_now() - timedelta(seconds=PURGE_MIN_AGE_SECONDS))
+    if purged:
+        return purged, files, blobs
+    result = await db.execute(select(ChatModel.id).where(ChatModel.deleted_at.is_not(None)).limit(1))
+    chat_id = result.scalar_one_or_none()
+    if chat_id is not None:
+        purged, files, blobs = await purge_messages(db, MessageModel.chat_id == chat_id)
+        if not purged:
+            await db.execute(delete(ChatModel).where(ChatModel.id == chat_id))
+        return purged or 1, files, blobs
+    deleted_users = select(UserModel.id).where(UserModel.deleted_at.is_not(None))
+    purged = await tombstone_messages(db, MessageModel.user_id.in_(deleted_users))
+    if purged:
+        return purged, [], []
+    result = await db.execute(delete(UserModel).where(UserModel.id.in_(
+        deleted_users.where(~exists().where(MessageModel.user_id == UserModel.id)).limit(PURGE_BATCH_SIZE))))
+    return result.rowcount, [], []
+
+
+class Purger:
+    def __init__(self):
+        self.last_error: str | None = None
+
+    async def run(self, session_maker=AsyncSessionLocal):
+        while True:
+            try:
+                purged = await self.drain(session_maker)
+                self.last_error = None
+            except Exception as exc:
+                logger.exception("purge batch failed")
+                self.last_error = repr(exc)
+                purged = 0
+            await asyncio.sleep(PURGE_PAUSE_MS / 1000 if purged else PURGE_POLL_SECONDS)
+
+    async def drain(self, session_maker=AsyncSessionLocal) -> int:
+        async with session_maker() as db:
+            purged, files, blobs = await purge_batch(db)
+            await db.commit()
+        await remove_blob_files(files)
+        await remove_blobs(blobs, session_maker)
+        return purged
+
+
+purger = Purger()
+
+
+if __name__ == "__main__":
+    async def main():
+        while await purger.drain():
+            await asyncio.sleep(PURGE_PAUSE_MS / 1000)
+
+    asyncio.run(main())
@@ -0,0 +1,163 @@
+import asyncio
+import bisect
+import os
+from sqlalchemy import bindparam, case, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from databases.databases import AsyncSessionLocal, ChatMember, ChatSummary, MessageModel
+from chats.cursors import encode_cursor, decode_cursor
+from users.profiles import load_profiles
+
+ACK_FLUSH_MS = float(os.getenv("ACK_FLUSH_MS", "500"))
+ACK_MAX_PENDING = int(os.getenv("ACK_MAX_PENDING", "10000"))
+
+
+def cursor_column(state: str):
+    return ChatMember.last_read_message_id if state == "read" else ChatMember.last_delivered_message_id
+
+
+async def write_acks(db: AsyncSession, acks: dict[tuple[int, int], tuple[int, int]]):
+    members = ChatMember.__table__
+    last_message_id = (select(func.coalesce(ChatSummary.last_message_id, 0))
+                       .where(ChatSummary.chat_id == members.c.chat_id)
+                       .scalar_subquery())
+    for column, index in ((members.c.last_read_message_id, 0), (members.c.last_delivered_message_id, 1)):
+        rows = [{"b_chat_id": chat_id, "b_user_id": user_id, "b_message_id": cursors[index]}
+                for (chat_id, user_id), cursors in acks.items() if cursors[index]]
+        if not rows:
+            continue
+        message_id = case((bindparam("b_message_id") < last_message_id, bindparam("b_message_id")),
+                          else_=last_message_id)
+        await db.execute(update(members)
+                         .where(members.c.chat_id == bindparam("b_chat_id"),
+                                members.c.user_id == bindparam("b_user_id"),
+                                column < message_id)
+                         .values({column: message_id}), rows)
+
+
+class AckBuffer:
+    def __init__(self, session_maker=AsyncSessionLocal):
+        self.session_maker = session_maker
+        # (chat id, user id) -> [read message id, delivered message id]
+        self.pending: dict[tuple[int, int], list[int]] = {}
+        self.arrived: asyncio.Event | None = None
+        self.full: asyncio.Event | None = None
+        self.task: asyncio.Task | None = None
+
+    def ack(self, chat_id: int, user_id: int, read_message_id: int = 0, delivered_message_id: int = 0):
+        if self.task is None or self.task.done():
+            self.arrived = asyncio.Event()
+            self.full = asyncio.Event()
+            self.task = asyncio.create_task(self.run())
+        self.merge({(chat_id, user_id): (read_message_id, max(read_message_id, delivered_message_id))})
+        self.arrived.set()
+        if len(self.pending) >= ACK_MAX_PENDING:
+            self.full.set()
+
+    def merge(self, acks: dict[tuple[int, int], tuple[int, int]]):
+        for key, (read_message_id, delivered_message_id) in acks.items():
+            cursors = self.pending.get(key)
+            if cursors is None:
+                self.pending[key] = [read_message_id, delivered_message_id]
+            else:
+                cursors[0] = max(cursors[0], read_message_id)
+                cursors[1] = max(cursors[1], delivered_message_id)
+
+    async def close(self):
+        if self.task is None:
+            return
+        task, self.task = self.task, None
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await self.flush()
+
+    async def run(self):
+        while True:
+            await self.arrived.wait()
+            try:
+                async with asyncio.timeout(ACK_FLUSH_MS / 1000):
+                    await self.full.wait()
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception:
+                await asyncio.sleep(ACK_FLUSH_MS / 1000)
+
+    async def flush(self):
+        acks, self.pending = self.pending, {}
+        self.arrived.clear()
+        self.full.clear()
+        if not acks:
+            return
+        try:
+            async with self.session_maker() as db:
+                await write_acks(db, acks)
+                await db.commit()
+        except BaseException:
+            self.merge(acks)
+            self.arrived.set()
+            raise
+
+
+async def cursor_histogram(db: AsyncSession, chat_id: int, state: str, low: int) -> tuple[list[int], list[int]]:
+    column = cursor_column(state)
+    result = await db.execute(select(column, func.count())
+                              .where(ChatMember.chat_id == chat_id, column >= low)
+                              .group_by(column).order_by(column))
+    cursors, counts = [], []
+    for cursor, count in result.all():
+        cursors.append(cursor)
+        counts.append(count)
+    counts.append(0)
+    for i in range(len(cursors) - 1, -1, -1):
+        counts[i] += counts[i + 1]
+    return cursors, counts
+
+
+def members_at(histogram: tuple[list[int], list[int]], message_id: int) -> int:
+    cursors, counts = histogram
+    return counts[bisect.bisect_left(cursors, message_id)]
+
+
+async def load_receipts(db: AsyncSession, chat_id: int, messages: list[MessageModel]) -> dict[int, dict]:
+    if not messages:
+        return {}
+    low = min(msg.id for msg in messages)
+    read = await cursor_histogram(db, chat_id, "read", low)
+    delivered = await cursor_histogram(db, chat_id, "delivered", low)
+    result = await db.execute(select(ChatMember.user_id, ChatMember.last_read_message_id,
+                                     ChatMember.last_delivered_message_id)
+                              .where(ChatMember.chat_id == chat_id,
+                                     ChatMember.user_id.in_({msg.user_id for msg in messages})))
+    senders = {user_id: (read_id, delivered_id) for user_id, read_id, delivered_id in result.all()}
+    receipts = {}
+    for msg in messages:
+        sender_read, sender_delivered = senders.get(msg.user_id, (0, 0))
+        receipts[msg.id] = {
+            "read_count": members_at(read, msg.id) - (sender_read >= msg.id),
+            "delivered_count": members_at(delivered, msg.id) - (sender_delivered >= msg.id)
+        }
+    return receipts
+
+
+async def seen_by(db: AsyncSession, chat_id: int, message_id: int, sender_id: int, state: str,
+                  limit: int, cursor: str | None) -> dict:
+    column = cursor_column(state)
+    seen = (ChatMember.chat_id == chat_id, column >= message_id, ChatMember.user_id != sender_id)
+    count = (await db.execute(select(func.count()).select_from(ChatMember).where(*seen))).scalar_one()
+    db_request = select(ChatMember.user_id).where(*seen)
+    if cursor is not None:
+        db_request = db_request.where(ChatMember.user_id > decode_cursor(cursor, int)[0])
+    result = await db.execute(db_request.order_by(ChatMember.user_id).limit(limit + 1))
+    user_ids = result.scalars().all()
+    has_more = len(user_ids) > limit
+    user_ids = user_ids[:limit]
+    profiles = await load_profiles(db, user_ids)
+    return {
+        "count": count,
+        "users": [profiles[user_id] for user_id in user_ids if user_id in profiles],
+        "next_cursor": encode_cursor(user_ids[-1]) if has_more else None
+    }
+
+
+ack_buffer = AckBuffer()
@@ -0,0 +1,39 @@
+import json
+from difflib import SequenceMatcher
+from sqlalchemy import select, desc
+from sqlalchemy.ext.asyncio import AsyncSession
+from databases.databases import MessageModel, MessageRevisionModel
+
+
+def make_delta(new_text: str, old_text: str) -> list:
+    # reverse delta: [start, end] copies new_text[start:end], a string is inserted as is
+    delta = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, new_text, old_text, autojunk=False).get_opcodes():
+        if tag == "equal":
+            delta.append([i1, i2])
+        elif j2 > j1:
+            delta.append(old_text[j1:j2])
+    if len(json.dumps(delta)) >= len(json.dumps(old_text)):
+        return [old_text]
+    return delta
+
+
+def apply_delta(new_text: str, delta: list) -> str:
+    return "".join(new_text[op[0]:op[1]] if isinstance(op, list) else op for op in delta)
+
+
+async def load_versions(db: AsyncSession, message: MessageModel, before: int, limit: int) -> list[dict]:
+    versions = []
+    if before > message.version:
+        versions.append({"version": message.version, "text": message.text,
+                         "created_at": message.edited_at or message.sent_at})
+    low = max(0, min(before, message.version) - limit)
+    result = await db.execute(select(MessageRevisionModel)
+                              .where(MessageRevisionModel.message_id == message.id, MessageRevisionModel.version >= low)
+                              .order_by(desc(MessageRevisionModel.version)))
+    text = message.text
+    for revision in result.scalars():
+        text = apply_delta(text, revision.delta)
+        if revision.version < before:
+            versions.append({"version": revision.version, "text": text, "created_at": revision.created_at})
+    return versions[:limit]
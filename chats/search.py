@@ -0,0 +1,160 @@
+import asyncio
+import sys
+from fastapi import HTTPException, status
+from sqlalchemy import Float, select, insert, delete, desc, exists, func, literal_column, text, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from databases.databases import AsyncSessionLocal, ChatMember, MessageModel, messages_fts
+from chats.cursors import encode_cursor, decode_cursor
+from chats.outbox import outbox_handler
+
+SNIPPET_OPEN = "<mark>"
+SNIPPET_CLOSE = "</mark>"
+SNIPPET_TOKENS = 16
+BACKFILL_BATCH_SIZE = 50_000
+
+
+def is_postgres(db: AsyncSession) -> bool:
+    return db.bind.dialect.name == "postgresql"
+
+
+@outbox_handler("message.sent", "message.edited", "message.deleted")
+async def sync_search_index(db: AsyncSession, payload: dict, idempotency_key: str):
+    if is_postgres(db):
+        return
+    message_id = payload["message_id"]
+    await db.execute(delete(messages_fts).where(messages_fts.c.rowid == message_id))
+    await db.execute(insert(messages_fts).from_select(
+        ["rowid", "text"], select(MessageModel.id, MessageModel.text)
+        .where(MessageModel.id == message_id, MessageModel.deleted_at.is_(None))))
+
+
+async def unindex_messages(db: AsyncSession, message_ids):
+    if not is_postgres(db):
+        await db.execute(delete(messages_fts).where(messages_fts.c.rowid.in_(message_ids)))
+
+
+def fts_query(query: str) -> str:
+    terms = []
+    for term in query.split():
+        prefix = term.endswith("*") and len(term) > 1
+        term = term.rstrip("*")
+        if term:
+            terms.append('"' + term.replace('"', '""') + '"' + ("*" if prefix else ""))
+    if not terms:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Empty search query"
+        )
+    return " ".join(terms)
+
+
+def search_hits(db: AsyncSession, query: str, ranked: bool):
+    if is_postgres(db):
+        tsquery = func.websearch_to_tsquery("simple", query)
+        search_vector = literal_column("messages.search_vector")
+        columns = [MessageModel.id.label("id")]
+        if ranked:
+            columns.append((-func.ts_rank_cd(search_vector, tsquery).cast(Float)).label("rank"))
+        return select(*columns).where(search_vector.op("@@")(tsquery)).subquery("hits")
+    columns = [messages_fts.c.rowid.label("id")]
+    if ranked:
+        columns.append(literal_column("rank").label("rank"))
+    return (select(*columns)
+            .where(literal_column("messages_fts").op("MATCH")(fts_query(query))).subquery("hits"))
+
+
+async def load_snippets(db: AsyncSession, query: str, message_ids: list[int]) -> dict[int, str]:
+    if not message_ids:
+        return {}
+    if is_postgres(db):
+        options = f"StartSel={SNIPPET_OPEN}, StopSel={SNIPPET_CLOSE}, MaxWords={SNIPPET_TOKENS}, MinWords=4"
+        result = await db.execute(select(MessageModel.id, func.ts_headline("simple", MessageModel.text,
+                                                                           func.websearch_to_tsquery("simple", query),
+                                                                           options))
+                                  .where(MessageModel.id.in_(message_ids)))
+    else:
+        result = await db.execute(select(messages_fts.c.rowid,
+                                         func.snippet(literal_column("messages_fts"), 0, SNIPPET_OPEN, SNIPPET_CLOSE,
+                                                      "…", SNIPPET_TOKENS))
+                                  .where(literal_column("messages_fts").op("MATCH")(fts_query(query)),
+                                         messages_fts.c.rowid.in_(message_ids)))
+    return dict(result.all())
+
+
+async def search_messages(db: AsyncSession, user_id: int, query: str, limit: int, cursor: str | None = None,
+                          chat_id: int | None = None, order: str = "rank") -> dict:
+    ranked = order == "rank"
+    hits = search_hits(db, query, ranked)
+    db_request = (
+        select(MessageModel.id, MessageModel.chat_id, MessageModel.user_id, MessageModel.sent_at,
+               *([hits.c.rank] if ranked else []))
+        .join(hits, hits.c.id == MessageModel.id)
+        .join(ChatMember, and_(ChatMember.chat_id == MessageModel.chat_id, ChatMember.user_id == user_id))
+        .where(MessageModel.deleted_at.is_(None))
+    )
+    if chat_id is not None:
+        db_request = db_request.where(MessageModel.chat_id == chat_id)
+    if ranked:
+        db_request = db_request.order_by(hits.c.rank, desc(hits.c.id))
+        if cursor is not None:
+            rank, message_id = decode_cursor(cursor, float, int)
+            db_request = db_request.where(or_(hits.c.rank > rank, and_(hits.c.rank == rank, hits.c.id < message_id)))
+    else:
+        db_request = db_request.order_by(desc(hits.c.id))
+        if cursor is not None:
+            db_request = db_request.where(hits.c.id < decode_cursor(cursor, int)[0])
+    result = await db.execute(db_request.limit(limit + 1))
+    rows = result.all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    snippets = await load_snippets(db, query, [row.id for row in rows])
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(repr(rows[-1].rank), rows[-1].id) if ranked else encode_cursor(rows[-1].id)
+    return {
+        "messages": [
+            {
+                "message_id": row.id,
+                "chat_id": row.chat_id,
+                "user_id": row.user_id,
+                "sent_at": row.sent_at,
+                "snippet": snippets.get(row.id)
+            }
+            for row in rows
+        ],
+        "next_cursor": next_cursor,
+        "has_more": has_more
+    }
+
+
+async def backfill():
+    async with AsyncSessionLocal() as db:
+        if is_postgres(db):
+            print("postgres keeps messages.search_vector up to date itself, nothing to backfill")
+            return
+        last_id = 0
+        while True:
+            result = await db.execute(select(MessageModel.id).where(MessageModel.id > last_id)
+                                      .order_by(MessageModel.id).offset(BACKFILL_BATCH_SIZE - 1).limit(1))
+            upper = result.scalar_one_or_none()
+            batch = select(MessageModel.id, MessageModel.text).where(
+                MessageModel.id > last_id, MessageModel.deleted_at.is_(None),
+                ~exists().where(messages_fts.c.rowid == MessageModel.id))
+            if upper is not None:
+                batch = batch.where(MessageModel.id <= upper)
+            await db.execute(insert(messages_fts).from_select(["rowid", "text"], batch))
+            await db.commit()
+            if upper is None:
+                break
+            last_id = upper
+            print(f"indexed messages up to id {last_id}")
+        await db.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('optimize')"))
+        await db.commit()
+        print("search index backfilled")
+
+
+if __name__ == "__main__":
+    commands = {"backfill": backfill}
+    if len(sys.argv) != 2 or sys.argv[1] not in commands:
+        sys.exit(f"usage: python -m chats.search {{{'|'.join(commands)}}}")
+    asyncio.run(commands[sys.argv[1]]())
@@ -0,0 +1,88 @@
+from sqlalchemy import bindparam, select, update, desc, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from databases.databases import ChatSummary, ChatMember, MessageModel
+
+SNIPPET_LENGTH = 100
+
+
+def create_summary(db: AsyncSession, chat_id: int):
+    db.add(ChatSummary(chat_id=chat_id, message_count=0))
+
+
+async def record_message(db: AsyncSession, message: MessageModel):
+    await record_messages(db, [message])
+
+
+async def record_messages(db: AsyncSession, messages: list[MessageModel]):
+    counts: dict[int, int] = {}
+    last_messages: dict[int, MessageModel] = {}
+    last_sent: dict[tuple[int, int], int] = {}
+    for message in messages:
+        counts[message.chat_id] = counts.get(message.chat_id, 0) + 1
+        if message.chat_id not in last_messages or last_messages[message.chat_id].id < message.id:
+            last_messages[message.chat_id] = message
+        key = (message.chat_id, message.user_id)
+        last_sent[key] = max(last_sent.get(key, 0), message.id)
+    summaries = ChatSummary.__table__
+    members = ChatMember.__table__
+    await db.execute(update(summaries).where(summaries.c.chat_id == bindparam("b_chat_id"))
+                     .values(message_count=summaries.c.message_count + bindparam("b_count")),
+                     [{"b_chat_id": chat_id, "b_count": count} for chat_id, count in counts.items()])
+    await db.execute(update(summaries)
+                     .where(summaries.c.chat_id == bindparam("b_chat_id"),
+                            or_(summaries.c.last_message_id.is_(None),
+                                summaries.c.last_message_id < bindparam("b_message_id")))
+                     .values(last_message_id=bindparam("b_message_id"), last_user_id=bindparam("b_user_id"),
+                             last_text=bindparam("b_text"), last_activity_at=bindparam("b_sent_at")),
+                     [{"b_chat_id": last.chat_id, "b_message_id": last.id, "b_user_id": last.user_id,
+                       "b_text": last.text[:SNIPPET_LENGTH], "b_sent_at": last.sent_at}
+                      for last in last_messages.values()])
+    await db.execute(update(members)
+                     .where(members.c.chat_id == bindparam("b_chat_id"), members.c.user_id == bindparam("b_user_id"),
+                            members.c.last_read_message_id < bindparam("b_message_id"))
+                     .values(last_read_message_id=bindparam("b_message_id"),
+                             last_delivered_message_id=bindparam("b_message_id")),
+                     [{"b_chat_id": chat_id, "b_user_id": user_id, "b_message_id": message_id}
+                      for (chat_id, user_id), message_id in last_sent.items()])
+
+
+async def record_edit(db: AsyncSession, chat_id: int, message_id: int, text: str):
+    await db.execute(update(ChatSummary)
+                     .where(ChatSummary.chat_id == chat_id, ChatSummary.last_message_id == message_id)
+                     .values(last_text=text[:SNIPPET_LENGTH]))
+
+
+async def next_edit_seq(db: AsyncSession, chat_id: int, count: int = 1) -> int:
+    result = await db.execute(update(ChatSummary).where(ChatSummary.chat_id == chat_id)
+                              .values(edit_seq=ChatSummary.edit_seq + count).returning(ChatSummary.edit_seq))
+    return result.scalar_one()
+
+
+async def record_delete(db: AsyncSession, chat_id: int, message_id: int):
+    await record_deletes(db, {chat_id: [message_id]})
+
+
+async def record_deletes(db: AsyncSession, deleted: dict[int, list[int]]):
+    summaries = ChatSummary.__table__
+    await db.execute(update(summaries).where(summaries.c.chat_id == bindparam("b_chat_id"))
+                     .values(message_count=summaries.c.message_count - bindparam("b_count")),
+                     [{"b_chat_id": chat_id, "b_count": len(message_ids)} for chat_id, message_ids in deleted.items()])
+    result = await db.execute(select(ChatSummary.chat_id, ChatSummary.last_message_id)
+                              .where(ChatSummary.chat_id.in_(deleted)))
+    for chat_id, last_message_id in result.all():
+        if last_message_id in deleted[chat_id]:
+            await refresh_last_message(db, chat_id)
+
+
+async def refresh_last_message(db: AsyncSession, chat_id: int):
+    result = await db.execute(select(MessageModel)
+                              .where(MessageModel.chat_id == chat_id, MessageModel.deleted_at.is_(None))
+                              .order_by(desc(MessageModel.id)).limit(1))
+    last = result.scalar_one_or_none()
+    if last is None:
+        await db.execute(update(ChatSummary).where(ChatSummary.chat_id == chat_id)
+                         .values(last_message_id=None, last_user_id=None, last_text=None))
+        return
+    await db.execute(update(ChatSummary).where(ChatSummary.chat_id == chat_id)
+                     .values(last_message_id=last.id, last_user_id=last.user_id,
+                             last_text=last.text[:SNIPPET_LENGTH], last_activity_at=last.sent_at))
@@ -1,10 +1,61 @@
 import asyncio
+import os
 from datetime import datetime, timezone
 
-from sqlalchemy import ForeignKey, String, Index
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy import DDL, JSON, CheckConstraint, ForeignKey, Integer, String, Index, UniqueConstraint, event, func, table, column
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-engine = create_async_engine(url="sqlite+aiosqlite:///databases/messanger.db", echo=True)
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///databases/messanger.db")
+DB_ECHO = os.getenv("DB_ECHO", "0") == "1"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))}",
+    f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))}",
+    f"PRAGMA cache_size=-{int(os.getenv('SQLITE_CACHE_SIZE_KIB', str(64 * 1024)))}",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",
+)
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def create_engine_from_settings(url: str = DATABASE_URL, echo: bool = DB_ECHO) -> AsyncEngine:
+    if url.startswith("sqlite"):
+        new_engine = create_async_engine(url, echo=echo)
+        event.listen(new_engine.sync_engine, "connect", set_sqlite_pragmas)
+        return new_engine
+    return create_async_engine(
+        url,
+        echo=echo,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING
+    )
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def search_key(source: str):
+    return lambda context: context.get_current_parameters()[source].lower()
+
+
+engine = create_engine_from_settings()
 AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
 
 
@@ -21,14 +72,23 @@ from sqlalchemy import ForeignKey, String
 from sqlalchemy.orm import Mapped, mapped_column
 
 
+class BlobModel(Base):
+    __tablename__ = "blobs"
+    sha256: Mapped[str] = mapped_column(String(64), primary_key=True)
+    filepath: Mapped[str] = mapped_column(String(512))
+    size: Mapped[int]
+    refcount: Mapped[int] = mapped_column(default=0)
+
+
 class AttachmentModel(Base):
     __tablename__ = "attachments"
     id: Mapped[int] = mapped_column(primary_key=True)
-    message_id: Mapped[int] = mapped_column(ForeignKey("messages.id", ondelete="CASCADE"))
+    message_id: Mapped[int] = mapped_column(ForeignKey("messages.id", ondelete="CASCADE"), index=True)
     filename: Mapped[str] = mapped_column(String(255))
     filepath: Mapped[str] = mapped_column(String(512))
     content_type: Mapped[str] = mapped_column(String(100))
     size: Mapped[int]
+    sha256: Mapped[str | None] = mapped_column(ForeignKey("blobs.sha256"), index=True)
 
 
 class PictureModel(Base):
@@ -39,7 +99,17 @@ class PictureModel(Base):
     size: Mapped[int]
     owner_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
     placement: Mapped[str] = mapped_column(default="avatar")
-    date: Mapped[datetime] = mapped_column(default=datetime.now(timezone.utc))
+    date: Mapped[datetime] = mapped_column(default=utc_now)
+
+class PictureVariantModel(Base):
+    __tablename__ = "picture_variants"
+    __table_args__ = (UniqueConstraint("picture_id", "width", name="uq_picture_variants_picture_width"),)
+    id: Mapped[int] = mapped_column(primary_key=True)
+    picture_id: Mapped[int] = mapped_column(ForeignKey("pictures.id", ondelete="CASCADE"))
+    width: Mapped[int]
+    media_type: Mapped[str] = mapped_column(String(32))
+    filepath: Mapped[str] = mapped_column(String(512))
+    size: Mapped[int]
 
 class MessageModel(Base):
     __tablename__ = "messages"
@@ -47,17 +117,69 @@ class MessageModel(Base):
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
     chat_id: Mapped[int] = mapped_column(ForeignKey("chats.id", ondelete="CASCADE"))
     text: Mapped[str] = mapped_column()
-    sent_at: Mapped[datetime] = mapped_column(default=datetime.now(timezone.utc))
+    sent_at: Mapped[datetime] = mapped_column(default=utc_now)
+    deleted_at: Mapped[datetime | None]
+    version: Mapped[int] = mapped_column(default=0, server_default="0")
+    edited_at: Mapped[datetime | None]
+    edit_seq: Mapped[int | None]
+
+
+Index("ix_messages_chat_id_deleted_at", MessageModel.chat_id, MessageModel.deleted_at, MessageModel.id)
+Index("ix_messages_user_id", MessageModel.user_id)
+Index("ix_messages_chat_id_edit_seq", MessageModel.chat_id, MessageModel.edit_seq,
+      sqlite_where=MessageModel.edit_seq.is_not(None), postgresql_where=MessageModel.edit_seq.is_not(None))
+Index("ix_messages_tombstones", MessageModel.id,
+      sqlite_where=MessageModel.deleted_at.is_not(None), postgresql_where=MessageModel.deleted_at.is_not(None))
+
+messages_fts = table("messages_fts", column("rowid", Integer), column("text", String))
+event.listen(MessageModel.__table__, "after_create", DDL(
+    "CREATE VIRTUAL TABLE messages_fts USING fts5(text, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+).execute_if(dialect="sqlite"))
+event.listen(MessageModel.__table__, "after_create", DDL(
+    "ALTER TABLE messages ADD COLUMN search_vector tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('simple', text)) STORED; "
+    "CREATE INDEX ix_messages_search_vector ON messages USING gin (search_vector)"
+).execute_if(dialect="postgresql"))
+event.listen(MessageModel.__table__, "before_drop", DDL("DROP TABLE IF EXISTS messages_fts").execute_if(dialect="sqlite"))
+
+
+class MessageRevisionModel(Base):
+    __tablename__ = "message_revisions"
+    message_id: Mapped[int] = mapped_column(ForeignKey("messages.id", ondelete="CASCADE"), primary_key=True)
+    version: Mapped[int] = mapped_column(primary_key=True)
+    created_at: Mapped[datetime]
+    delta: Mapped[list] = mapped_column(JSON)
+
+
+class OutboxModel(Base):
+    __tablename__ = "outbox"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    topic: Mapped[str] = mapped_column(String(50))
+    handler: Mapped[str] = mapped_column(String(50))
+    idempotency_key: Mapped[str] = mapped_column(String(160), unique=True)
+    payload: Mapped[dict] = mapped_column(JSON)
+    status: Mapped[str] = mapped_column(String(20), default="pending")
+    attempts: Mapped[int] = mapped_column(default=0)
+    last_error: Mapped[str | None] = mapped_column(String(255))
+    available_at: Mapped[datetime] = mapped_column(default=utc_now)
+    created_at: Mapped[datetime] = mapped_column(default=utc_now)
+
 
+Index("ix_outbox_status_available_at", OutboxModel.status, OutboxModel.available_at)
 
-Index("idx_messages_chat_sent", MessageModel.chat_id, MessageModel.sent_at)
 
 class ChatMember(Base):
     __tablename__ = "chat_members"
     chat_id: Mapped[int] = mapped_column(ForeignKey("chats.id", ondelete="CASCADE"), primary_key=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True, index=True)
     role: Mapped[str] = mapped_column(String(20), default="member")
-    joined_at: Mapped[datetime] = mapped_column(default=datetime.now(timezone.utc))
+    joined_at: Mapped[datetime] = mapped_column(default=utc_now)
+    last_read_message_id: Mapped[int] = mapped_column(default=0, server_default="0")
+    last_delivered_message_id: Mapped[int] = mapped_column(default=0, server_default="0")
+
+
+Index("ix_chat_members_chat_id_last_read", ChatMember.chat_id, ChatMember.last_read_message_id)
+Index("ix_chat_members_chat_id_last_delivered", ChatMember.chat_id, ChatMember.last_delivered_message_id)
 
 
 class ChatModel(Base):
@@ -66,16 +188,43 @@ class ChatModel(Base):
     is_private: Mapped[bool] = mapped_column(default=True)
     name: Mapped[str] = mapped_column(nullable=True)
     status: Mapped[str] = mapped_column(default="opened")
+    deleted_at: Mapped[datetime | None]
+
+
+Index("ix_chats_tombstones", ChatModel.id,
+      sqlite_where=ChatModel.deleted_at.is_not(None), postgresql_where=ChatModel.deleted_at.is_not(None))
+
+
+class DirectChatModel(Base):
+    __tablename__ = "direct_chats"
+    __table_args__ = (CheckConstraint("min_user_id < max_user_id", name="ck_direct_chats_ordered_pair"),)
+    min_user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    max_user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    chat_id: Mapped[int] = mapped_column(ForeignKey("chats.id", ondelete="CASCADE"), unique=True)
+
+
+class ChatSummary(Base):
+    __tablename__ = "chat_summaries"
+    chat_id: Mapped[int] = mapped_column(ForeignKey("chats.id", ondelete="CASCADE"), primary_key=True)
+    last_message_id: Mapped[int | None]
+    last_user_id: Mapped[int | None]
+    last_text: Mapped[str | None] = mapped_column(String(100))
+    last_activity_at: Mapped[datetime] = mapped_column(default=utc_now)
+    message_count: Mapped[int] = mapped_column(default=0)
+    edit_seq: Mapped[int] = mapped_column(default=0, server_default="0")
 
 
 class UserFriends(Base):
     __tablename__ = "user_friends"
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
     friend_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
-    created_at: Mapped[datetime] = mapped_column(default=datetime.now(timezone.utc))
+    created_at: Mapped[datetime] = mapped_column(default=utc_now)
     status: Mapped[str] = mapped_column(String(20), default="pending")
 
 
+Index("ix_user_friends_friend_id", UserFriends.friend_id, UserFriends.user_id)
+
+
 class UserModel(Base):
     __tablename__ = "users"
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -84,4 +233,12 @@ class UserModel(Base):
     hash_pwd: Mapped[str]
     bio: Mapped[str]
     email: Mapped[str] = mapped_column(index=True)
+    deleted_at: Mapped[datetime | None]
+    name_key: Mapped[str] = mapped_column(default=search_key("name"), index=True)
+    lastname_key: Mapped[str] = mapped_column(default=search_key("lastname"), index=True)
+
+
+Index("ix_users_email_lower", func.lower(UserModel.email))
+Index("ix_users_tombstones", UserModel.id,
+      sqlite_where=UserModel.deleted_at.is_not(None), postgresql_where=UserModel.deleted_at.is_not(None))
 
@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends, Path
+import bisect
+from typing import Optional
+from fastapi import APIRouter, Depends, Path, Query
 from fastapi import HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, delete, update, or_
 from auth.validation import get_current_user
+from chats.cursors import encode_cursor, decode_cursor
 from databases.databases import get_db, UserModel, UserFriends
+from friends.graph import load_friend_ids, invalidate_friends
+from users.profiles import load_profiles
 
 friends_router = APIRouter(prefix="/friends", tags=["friends"])
 
@@ -11,7 +16,7 @@ friends_router = APIRouter(prefix="/friends", tags=["friends"])
 @friends_router.post("/{user_id}/init")
 async def init_friend(user_id: int = Path(ge=1), requester_id: int = Depends(get_current_user),
                       db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(UserModel).where(UserModel.id == user_id))
+    result = await db.execute(select(UserModel).where(UserModel.id == user_id, UserModel.deleted_at.is_(None)))
     if not result.scalar_one_or_none():
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -47,7 +52,7 @@ async def init_friend(user_id: int = Path(ge=1), requester_id: int = Depends(get
 @friends_router.post("/{user_id}/accept")
 async def accept_friend(user_id: int = Path(ge=1), requester_id: int = Depends(get_current_user),
                         db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(UserModel).where(UserModel.id == user_id))
+    result = await db.execute(select(UserModel).where(UserModel.id == user_id, UserModel.deleted_at.is_(None)))
     if not result.scalar_one_or_none():
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -62,6 +67,7 @@ async def accept_friend(user_id: int = Path(ge=1), requester_id: int = Depends(g
             detail="Request not found"
         )
     await db.commit()
+    invalidate_friends((user_id, requester_id))
     return {"ok": True}
 
 
@@ -81,4 +87,57 @@ async def delete_friend(user_id: int = Path(ge=1), requester_id: int = Depends(g
             detail="Friend not found"
         )
     await db.commit()
+    invalidate_friends((user_id, requester_id))
     return {"ok": True}
+
+
+@friends_router.get("")
+async def get_friends(limit: int = Query(50, ge=1, le=200), cursor: Optional[str] = None,
+                      user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    friend_ids = sorted(await load_friend_ids(db, user_id))
+    start = bisect.bisect_right(friend_ids, decode_cursor(cursor, int)[0]) if cursor is not None else 0
+    return await friends_page(db, friend_ids[start:start + limit + 1], limit)
+
+
+@friends_router.get("/requests/incoming")
+async def get_incoming_requests(limit: int = Query(50, ge=1, le=200), cursor: Optional[str] = None,
+                                user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    db_request = select(UserFriends.user_id).where(UserFriends.friend_id == user_id, UserFriends.status == "pending")
+    if cursor is not None:
+        db_request = db_request.where(UserFriends.user_id > decode_cursor(cursor, int)[0])
+    result = await db.execute(db_request.order_by(UserFriends.user_id).limit(limit + 1))
+    return await friends_page(db, result.scalars().all(), limit)
+
+
+@friends_router.get("/requests/outgoing")
+async def get_outgoing_requests(limit: int = Query(50, ge=1, le=200), cursor: Optional[str] = None,
+                                user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    db_request = select(UserFriends.friend_id).where(UserFriends.user_id == user_id, UserFriends.status == "pending")
+    if cursor is not None:
+        db_request = db_request.where(UserFriends.friend_id > decode_cursor(cursor, int)[0])
+    result = await db.execute(db_request.order_by(UserFriends.friend_id).limit(limit + 1))
+    return await friends_page(db, result.scalars().all(), limit)
+
+
+@friends_router.get("/{user_id}/mutual")
+async def get_mutual_friends(user_id: int = Path(ge=1), limit: int = Query(20, ge=0, le=200),
+                             requester_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    mutual = await load_friend_ids(db, requester_id) & await load_friend_ids(db, user_id)
+    user_ids = sorted(mutual)[:limit]
+    profiles = await load_profiles(db, user_ids)
+    return {
+        "ok": True,
+        "count": len(mutual),
+        "users": [profiles[id] for id in user_ids if id in profiles]
+    }
+
+
+async def friends_page(db: AsyncSession, user_ids: list[int], limit: int) -> dict:
+    has_more = len(user_ids) > limit
+    user_ids = user_ids[:limit]
+    profiles = await load_profiles(db, user_ids)
+    return {
+        "ok": True,
+        "users": [profiles[id] for id in user_ids if id in profiles],
+        "next_cursor": encode_cursor(user_ids[-1]) if has_more else None
+    }
@@ -0,0 +1,28 @@
+import os
+from sqlalchemy import select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from auth.cache import TTLCache
+from databases.databases import UserFriends
+
+FRIENDS_CACHE_SIZE = int(os.getenv("FRIENDS_CACHE_SIZE", "50000"))
+FRIENDS_CACHE_TTL_SECONDS = float(os.getenv("FRIENDS_CACHE_TTL_SECONDS", "300"))
+
+# user id -> frozenset of accepted friend ids, in both directions
+friends_cache = TTLCache(FRIENDS_CACHE_SIZE, FRIENDS_CACHE_TTL_SECONDS)
+
+
+async def load_friend_ids(db: AsyncSession, user_id: int) -> frozenset[int]:
+    friend_ids = friends_cache.get(user_id)
+    if friend_ids is None:
+        result = await db.execute(union_all(
+            select(UserFriends.friend_id).where(UserFriends.user_id == user_id, UserFriends.status == "accepted"),
+            select(UserFriends.user_id).where(UserFriends.friend_id == user_id, UserFriends.status == "accepted")
+        ))
+        friend_ids = frozenset(result.scalars().all())
+        friends_cache.set(user_id, friend_ids)
+    return friend_ids
+
+
+def invalidate_friends(user_ids):
+    for user_id in user_ids:
+        friends_cache.invalidate(user_id)
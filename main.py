@@ -1,3 +1,5 @@
+import asyncio
+from contextlib import asynccontextmanager
 import uvicorn
 from fastapi import FastAPI
 from users.users import users_router
@@ -5,11 +7,38 @@ from chats.chats import chats_router
 from auth.auth import auth_router
 from friends.friends import friends_router
 from media.nginx_sim import media_router
-app = FastAPI()
+from media.proxy import MediaProxyMiddleware, MEDIA_PROXY_SIM
+from users.directory import user_directory, USER_DIRECTORY_INDEX
+from chats.outbox import outbox_worker, OUTBOX_WORKER
+from chats.purge import purger, PURGE_WORKER
+from chats.ingest import message_writer
+from chats.receipts import ack_buffer
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = []
+    if USER_DIRECTORY_INDEX:
+        tasks.append(asyncio.create_task(user_directory.load()))
+    if OUTBOX_WORKER:
+        tasks.append(asyncio.create_task(outbox_worker.run()))
+    if PURGE_WORKER:
+        tasks.append(asyncio.create_task(purger.run()))
+    yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await message_writer.close()
+    await ack_buffer.close()
+
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(users_router)
 app.include_router(chats_router)
 app.include_router(auth_router)
 app.include_router(friends_router)
 app.include_router(media_router)
+if MEDIA_PROXY_SIM:
+    app.add_middleware(MediaProxyMiddleware)
 if __name__ == "__main__":
     uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import os
+import sys
+from pathlib import Path as PathLib
+from fastapi import UploadFile
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from databases.databases import AsyncSessionLocal, AttachmentModel, BlobModel
+from media.MediaInfo import MAX_FILE_SIZE, MEDIA_ROOT
+from media.uploads import StoredFile, CHUNK_SIZE, hash_upload, store_upload, remove_file
+
+BLOB_DIR = "blobs"
+DEDUPE_BATCH_SIZE = 500
+
+
+def blob_path(sha256: str) -> str:
+    return f"{BLOB_DIR}/{sha256[:2]}/{sha256}"
+
+
+async def store_blob(db: AsyncSession, file: UploadFile, max_size: int = MAX_FILE_SIZE) -> StoredFile:
+    stored = await write_blob(db, file, max_size)
+    await acquire_blob(db, stored.sha256, stored.filepath, stored.size, file=file)
+    return stored
+
+
+async def write_blob(db: AsyncSession, file: UploadFile, max_size: int = MAX_FILE_SIZE) -> StoredFile:
+    size, sha256 = await hash_upload(file, max_size)
+    result = await db.execute(select(BlobModel.filepath).where(BlobModel.sha256 == sha256))
+    filepath = result.scalar_one_or_none()
+    if filepath is None or not await asyncio.to_thread((PathLib(MEDIA_ROOT) / filepath).is_file):
+        stored = await store_upload(file, f"{BLOB_DIR}/{sha256[:2]}", max_size=max_size, filename=sha256)
+        filepath, size, sha256 = stored.filepath, stored.size, stored.sha256
+    return StoredFile(filepath=filepath, size=size, sha256=sha256)
+
+
+async def acquire_blob(db: AsyncSession, sha256: str, filepath: str, size: int, count: int = 1,
+                       file: UploadFile | None = None):
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(BlobModel).values(sha256=sha256, filepath=filepath, size=size, refcount=count)
+    result = await db.execute(stmt.on_conflict_do_update(index_elements=[BlobModel.sha256],
+                                                         set_={"refcount": BlobModel.refcount + count})
+                              .returning(BlobModel.refcount))
+    if result.scalar_one() != count or await asyncio.to_thread((PathLib(MEDIA_ROOT) / filepath).is_file):
+        return
+    if file is None:
+        raise RuntimeError(f"Blob {sha256} is missing from {filepath}")
+    await file.seek(0)
+    await store_upload(file, f"{BLOB_DIR}/{sha256[:2]}", filename=sha256)
+
+
+async def release_blobs(db: AsyncSession, message_ids) -> list[str]:
+    result = await db.execute(select(AttachmentModel.sha256, func.count())
+                              .where(AttachmentModel.message_id.in_(message_ids), AttachmentModel.sha256.is_not(None))
+                              .group_by(AttachmentModel.sha256))
+    released = result.all()
+    for sha256, count in released:
+        await db.execute(update(BlobModel).where(BlobModel.sha256 == sha256)
+                         .values(refcount=BlobModel.refcount - count))
+    return [sha256 for sha256, _ in released]
+
+
+async def collect_blobs(db: AsyncSession, hashes: list[str]) -> list[str]:
+    if not hashes:
+        return []
+    result = await db.execute(select(BlobModel.sha256).where(BlobModel.sha256.in_(hashes), BlobModel.refcount <= 0))
+    return result.scalars().all()
+
+
+async def remove_blobs(hashes: list[str], session_maker=AsyncSessionLocal):
+    for sha256 in hashes:
+        async with session_maker() as db:
+            result = await db.execute(delete(BlobModel).where(BlobModel.sha256 == sha256, BlobModel.refcount <= 0)
+                                      .returning(BlobModel.filepath))
+            filepath = result.scalar_one_or_none()
+            if filepath is not None:
+                await asyncio.to_thread(remove_file, PathLib(MEDIA_ROOT) / filepath)
+            await db.commit()
+
+
+async def remove_blob_files(filepaths: list[str]):
+    for filepath in filepaths:
+        await asyncio.to_thread(remove_file, PathLib(MEDIA_ROOT) / filepath)
+
+
+async def dedupe():
+    last_id = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(AttachmentModel)
+                                      .where(AttachmentModel.sha256.is_(None), AttachmentModel.id > last_id)
+                                      .order_by(AttachmentModel.id).limit(DEDUPE_BATCH_SIZE))
+            batch = result.scalars().all()
+            if not batch:
+                return
+            last_id = batch[-1].id
+            sources = []
+            for attachment in batch:
+                source = PathLib(MEDIA_ROOT) / attachment.filepath
+                if not source.is_file():
+                    print(f"attachment {attachment.id}: {attachment.filepath} is missing, skipped")
+                    continue
+                sha256 = await asyncio.to_thread(_hash_file, source)
+                filepath = blob_path(sha256)
+                await asyncio.to_thread(_link_into_store, source, PathLib(MEDIA_ROOT) / filepath)
+                await acquire_blob(db, sha256, filepath, source.stat().st_size)
+                attachment.filepath = filepath
+                attachment.sha256 = sha256
+                sources.append(source)
+            await db.commit()
+            for source in sources:
+                await asyncio.to_thread(remove_file, source)
+            print(f"deduplicated attachments up to id {last_id}")
+
+
+async def sweep():
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(BlobModel.sha256).where(BlobModel.refcount <= 0))
+        await remove_blobs(result.scalars().all())
+        result = await db.execute(select(BlobModel.sha256))
+        known = set(result.scalars().all())
+    removed = 0
+    for path in (PathLib(MEDIA_ROOT) / BLOB_DIR).glob("*/*"):
+        if path.name not in known and not path.name.endswith(".part"):
+            await asyncio.to_thread(remove_file, path)
+            removed += 1
+    print(f"removed {removed} unreferenced blob files")
+
+
+def _hash_file(path: PathLib) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _link_into_store(source: PathLib, target: PathLib):
+    if target.exists():
+        return
+    target.parent.mkdir(parents=True, exist_ok=True)
+    os.link(source, target)
+
+
+if __name__ == "__main__":
+    commands = {"dedupe": dedupe, "sweep": sweep}
+    if len(sys.argv) != 2 or sys.argv[1] not in commands:
+        sys.exit(f"usage: python -m media.blobs {{{'|'.join(commands)}}}")
+    asyncio.run(commands[sys.argv[1]]())
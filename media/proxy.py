@@ -0,0 +1,81 @@
+import mimetypes
+import os
+from pathlib import Path as PathLib
+from urllib.parse import unquote
+from starlette.datastructures import Headers, QueryParams
+from starlette.responses import FileResponse, PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from media.MediaInfo import MEDIA_ROOT
+from media.responses import MEDIA_ACCEL_PREFIX, SIGNED_URL_PREFIX, verify_media_signature
+
+MEDIA_PROXY_SIM = os.getenv("MEDIA_PROXY_SIM", "0") == "1"
+PASSTHROUGH_HEADERS = ("content-type", "content-disposition", "cache-control", "etag", "last-modified")
+
+
+class MediaProxyMiddleware:
+    def __init__(self, app: ASGIApp, root: str = MEDIA_ROOT):
+        self.app = app
+        self.root = PathLib(root).resolve()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        if scope["path"].startswith(SIGNED_URL_PREFIX):
+            return await self.serve_signed(scope, receive, send)
+        redirected = {}
+
+        async def intercept(message: Message):
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                target = self.resolve(headers)
+                if target is not None:
+                    redirected["path"] = target
+                    redirected["headers"] = {k: headers[k] for k in PASSTHROUGH_HEADERS if k in headers}
+                    return
+            if redirected:
+                return
+            await send(message)
+
+        await self.app(scope, receive, intercept)
+        if redirected:
+            await self.serve(redirected["path"], redirected["headers"], scope, receive, send)
+
+    def resolve(self, headers: Headers) -> PathLib | None:
+        if "x-accel-redirect" in headers:
+            location = unquote(headers["x-accel-redirect"])
+            if location.startswith(MEDIA_ACCEL_PREFIX):
+                return self.confine(location.removeprefix(MEDIA_ACCEL_PREFIX))
+        if "x-sendfile" in headers:
+            return self.confine(headers["x-sendfile"])
+        return None
+
+    def confine(self, relative_path: str) -> PathLib | None:
+        path = (self.root / relative_path).resolve()
+        return path if path.is_relative_to(self.root) else None
+
+    async def serve_signed(self, scope: Scope, receive: Receive, send: Send):
+        relative_path = unquote(scope["path"].removeprefix(SIGNED_URL_PREFIX))
+        params = QueryParams(scope["query_string"])
+        try:
+            expires = int(params.get("expires", ""))
+        except ValueError:
+            expires = 0
+        media_type = params.get("response-content-type", "")
+        disposition = params.get("response-content-disposition", "")
+        path = self.confine(relative_path)
+        if path is None or not verify_media_signature(relative_path, expires, params.get("signature", ""),
+                                                      media_type, disposition):
+            return await PlainTextResponse("Forbidden", status_code=403)(scope, receive, send)
+        headers = {
+            "content-type": media_type or mimetypes.guess_type(path.name)[0] or "application/octet-stream",
+            "cache-control": "private, max-age=300"
+        }
+        if disposition:
+            headers["content-disposition"] = disposition
+        await self.serve(path, headers, scope, receive, send)
+
+    async def serve(self, path: PathLib, headers: dict, scope: Scope, receive: Receive, send: Send):
+        if not path.is_file():
+            return await PlainTextResponse("Not Found", status_code=404)(scope, receive, send)
+        media_type = headers.pop("content-type", None)
+        await FileResponse(path, media_type=media_type, headers=headers)(scope, receive, send)
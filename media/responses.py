@@ -0,0 +1,102 @@
+import base64
+import hashlib
+import hmac
+import os
+import time
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path as PathLib
+from urllib.parse import quote, urlencode
+from fastapi import HTTPException, Request, Response, status
+from fastapi.responses import FileResponse, RedirectResponse
+from auth.crypto import SECRET_KEY
+from media.MediaInfo import MEDIA_ROOT
+
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+# python | x-accel | x-sendfile | signed
+MEDIA_DELIVERY = os.getenv("MEDIA_DELIVERY", "python")
+MEDIA_ACCEL_PREFIX = os.getenv("MEDIA_ACCEL_PREFIX", "/protected/")
+SIGNED_URL_PREFIX = os.getenv("SIGNED_URL_PREFIX", "/signed-media/")
+SIGNED_URL_TTL_SECONDS = int(os.getenv("SIGNED_URL_TTL_SECONDS", "300"))
+MEDIA_SIGNING_KEY = os.getenv("MEDIA_SIGNING_KEY", SECRET_KEY).encode()
+
+
+def media_response(request: Request, path: PathLib, etag: str, media_type: str, filename: str,
+                   inline: bool = True, last_modified: datetime | None = None, immutable: bool = False) -> Response:
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+    }
+    if last_modified is not None:
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+        headers["Last-Modified"] = formatdate(last_modified.timestamp(), usegmt=True)
+    if is_not_modified(request, headers["ETag"], last_modified):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if MEDIA_DELIVERY != "python":
+        return offloaded_response(path, headers, media_type, filename, inline)
+    if not path.is_file():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File missing")
+    return FileResponse(
+        path=path,
+        media_type=media_type,
+        filename=filename,
+        content_disposition_type="inline" if inline else "attachment",
+        headers=headers
+    )
+
+
+def is_not_modified(request: Request, etag: str, last_modified: datetime | None) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    return int(last_modified.timestamp()) <= since.timestamp()
+
+
+def offloaded_response(path: PathLib, headers: dict, media_type: str, filename: str, inline: bool) -> Response:
+    relative_path = path.relative_to(MEDIA_ROOT).as_posix()
+    disposition = f"{'inline' if inline else 'attachment'}; filename*=utf-8''{quote(filename)}"
+    if MEDIA_DELIVERY == "signed":
+        return RedirectResponse(signed_media_url(relative_path, media_type=media_type, disposition=disposition),
+                                status_code=status.HTTP_307_TEMPORARY_REDIRECT,
+                                headers={"Cache-Control": "private, no-store"})
+    headers["Content-Type"] = media_type
+    headers["Content-Disposition"] = disposition
+    if MEDIA_DELIVERY == "x-accel":
+        headers["X-Accel-Redirect"] = MEDIA_ACCEL_PREFIX + quote(relative_path)
+    else:
+        headers["X-Sendfile"] = str(path.resolve())
+    return Response(headers=headers)
+
+
+def signed_media_url(relative_path: str, expires: int | None = None, media_type: str = "",
+                     disposition: str = "") -> str:
+    expires = expires or int(time.time()) + SIGNED_URL_TTL_SECONDS
+    params = {"expires": expires}
+    if media_type:
+        params["response-content-type"] = media_type
+    if disposition:
+        params["response-content-disposition"] = disposition
+    params["signature"] = media_signature(relative_path, expires, media_type, disposition)
+    return f"{SIGNED_URL_PREFIX}{quote(relative_path)}?{urlencode(params, quote_via=quote)}"
+
+
+def media_signature(relative_path: str, expires: int, media_type: str = "", disposition: str = "") -> str:
+    message = "\n".join((relative_path, str(expires), media_type, disposition)).encode()
+    digest = hmac.new(MEDIA_SIGNING_KEY, message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode().rstrip("=")
+
+
+def verify_media_signature(relative_path: str, expires: int, signature: str, media_type: str = "",
+                           disposition: str = "") -> bool:
+    return expires >= time.time() and hmac.compare_digest(
+        media_signature(relative_path, expires, media_type, disposition), signature)
@@ -0,0 +1,124 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path as PathLib
+from fastapi import HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from databases.databases import AsyncSessionLocal, PictureModel, PictureVariantModel
+from media.MediaInfo import MEDIA_ROOT
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+THUMBNAIL_SIZES = (64, 256, 1024)
+THUMBNAIL_DIR = "thumbnails"
+THUMBNAIL_FORMAT = os.getenv("THUMBNAIL_FORMAT", "webp")
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "80"))
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+THUMBNAIL_MEDIA_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+THUMBNAIL_EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+
+thumbnail_executor = ProcessPoolExecutor(max_workers=THUMBNAIL_WORKERS)
+
+
+def check_width(width: int | None):
+    if width is not None and width not in THUMBNAIL_SIZES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"size should be one of {', '.join(map(str, THUMBNAIL_SIZES))}"
+        )
+
+
+def variant_path(filepath: str, width: int) -> str:
+    return f"{THUMBNAIL_DIR}/{width}/{PathLib(filepath).stem}.{THUMBNAIL_EXTENSIONS[THUMBNAIL_FORMAT]}"
+
+
+async def render_variant(filepath: str, width: int) -> PictureVariantModel:
+    target = variant_path(filepath, width)
+    size = await asyncio.get_running_loop().run_in_executor(
+        thumbnail_executor, _render, str(PathLib(MEDIA_ROOT) / filepath), str(PathLib(MEDIA_ROOT) / target),
+        width, THUMBNAIL_FORMAT, THUMBNAIL_QUALITY
+    )
+    return PictureVariantModel(width=width, media_type=THUMBNAIL_MEDIA_TYPES[THUMBNAIL_FORMAT], filepath=target,
+                               size=size)
+
+
+async def cached_variant(filepath: str, width: int) -> PictureVariantModel | None:
+    if Image is None:
+        return None
+    target = variant_path(filepath, width)
+    try:
+        stat = await asyncio.to_thread(os.stat, PathLib(MEDIA_ROOT) / target)
+    except FileNotFoundError:
+        try:
+            return await render_variant(filepath, width)
+        except OSError:
+            return None
+    return PictureVariantModel(width=width, media_type=THUMBNAIL_MEDIA_TYPES[THUMBNAIL_FORMAT], filepath=target,
+                               size=stat.st_size)
+
+
+async def picture_variants(db: AsyncSession, pictures: list[PictureModel], width: int) -> dict[int, PictureVariantModel]:
+    if Image is None or not pictures:
+        return {}
+    result = await db.execute(select(PictureVariantModel)
+                              .where(PictureVariantModel.picture_id.in_([p.id for p in pictures]),
+                                     PictureVariantModel.width == width))
+    variants = {variant.picture_id: variant for variant in result.scalars().all()}
+    missing = [p for p in pictures
+               if p.id not in variants or not (PathLib(MEDIA_ROOT) / variants[p.id].filepath).is_file()]
+    if not missing:
+        return variants
+    rendered = await asyncio.gather(*(render_variant(p.filepath, width) for p in missing), return_exceptions=True)
+    fresh = []
+    for picture, variant in zip(missing, rendered):
+        if isinstance(variant, PictureVariantModel):
+            variant.picture_id = picture.id
+            variants[picture.id] = variant
+            fresh.append(variant)
+    await save_variants(db, fresh)
+    await db.commit()
+    return variants
+
+
+async def save_variants(db: AsyncSession, variants: list[PictureVariantModel]):
+    if not variants:
+        return
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(PictureVariantModel).values([
+        {"picture_id": v.picture_id, "width": v.width, "media_type": v.media_type, "filepath": v.filepath,
+         "size": v.size}
+        for v in variants
+    ])
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[PictureVariantModel.picture_id, PictureVariantModel.width],
+        set_={"media_type": stmt.excluded.media_type, "filepath": stmt.excluded.filepath, "size": stmt.excluded.size}
+    ))
+
+
+async def generate_variants(picture_id: int):
+    if Image is None:
+        return
+    async with AsyncSessionLocal() as db:
+        picture = await db.get(PictureModel, picture_id)
+        if picture is None:
+            return
+        for width in THUMBNAIL_SIZES:
+            await picture_variants(db, [picture], width)
+
+
+def _render(source: str, target: str, width: int, fmt: str, quality: int) -> int:
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_path = f"{target}.{os.getpid()}.part"
+    with Image.open(source) as image:
+        image.draft("RGB", (width, width))
+        image.thumbnail((width, width))
+        if image.mode not in ("RGB", "RGBA") or fmt == "jpeg" and image.mode != "RGB":
+            image = image.convert("RGB")
+        image.save(tmp_path, format=fmt.upper(), quality=quality)
+    os.replace(tmp_path, target)
+    return os.path.getsize(target)
@@ -0,0 +1,71 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import uuid
+from dataclasses import dataclass
+from pathlib import Path as PathLib
+from fastapi import HTTPException, UploadFile, status
+from media.MediaInfo import MAX_FILE_SIZE, MEDIA_ROOT
+
+CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class StoredFile:
+    filepath: str
+    size: int
+    sha256: str
+
+
+async def store_upload(file: UploadFile, directory: str, ext: str = "", max_size: int = MAX_FILE_SIZE,
+                       filename: str | None = None) -> StoredFile:
+    target_dir = PathLib(MEDIA_ROOT) / directory
+    await asyncio.to_thread(target_dir.mkdir, parents=True, exist_ok=True)
+    fd, tmp_path = await asyncio.to_thread(tempfile.mkstemp, dir=target_dir, suffix=".part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := await file.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise file_too_large(max_size)
+                await asyncio.to_thread(_write_chunk, out, digest, chunk)
+        filename = filename or f"{uuid.uuid4().hex}{ext}"
+        await asyncio.to_thread(os.replace, tmp_path, target_dir / filename)
+    except BaseException:
+        await asyncio.to_thread(remove_file, tmp_path)
+        raise
+    return StoredFile(filepath=f"{directory}/{filename}", size=size, sha256=digest.hexdigest())
+
+
+async def hash_upload(file: UploadFile, max_size: int = MAX_FILE_SIZE) -> tuple[int, str]:
+    digest = hashlib.sha256()
+    size = 0
+    while chunk := await file.read(CHUNK_SIZE):
+        size += len(chunk)
+        if size > max_size:
+            raise file_too_large(max_size)
+        await asyncio.to_thread(digest.update, chunk)
+    await file.seek(0)
+    return size, digest.hexdigest()
+
+
+def file_too_large(max_size: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File too large. Max size is {max_size // (1024 * 1024)} MB"
+    )
+
+
+def _write_chunk(out, digest, chunk: bytes):
+    digest.update(chunk)
+    out.write(chunk)
+
+
+def remove_file(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,38 @@
+import pytest
+from sqlalchemy import select, text, update
+from databases.databases import ChatModel, MessageModel, UserModel, utc_now, engine
+
+pytestmark = pytest.mark.anyio
+
+
+async def add_message(db) -> MessageModel:
+    user = UserModel(name="Name", lastname="Last", hash_pwd="", bio="", email="user@example.com")
+    chat = ChatModel(is_private=False, name="chat")
+    db.add_all([user, chat])
+    await db.flush()
+    message = MessageModel(user_id=user.id, chat_id=chat.id, text="hello")
+    db.add(message)
+    await db.commit()
+    return message
+
+
+async def test_engine_profile(db):
+    async with engine.connect() as conn:
+        if engine.dialect.name == "sqlite":
+            assert (await conn.execute(text("PRAGMA journal_mode"))).scalar_one() == "wal"
+            assert (await conn.execute(text("PRAGMA foreign_keys"))).scalar_one() == 1
+        else:
+            assert (await conn.execute(text("SELECT 1"))).scalar_one() == 1
+
+
+async def test_timestamps_round_trip(db):
+    message = await add_message(db)
+    deleted_at = utc_now()
+    await db.execute(update(MessageModel).where(MessageModel.id == message.id)
+                     .values(deleted_at=deleted_at, edited_at=deleted_at))
+    await db.commit()
+    result = await db.execute(select(MessageModel.sent_at, MessageModel.deleted_at)
+                              .where(MessageModel.id == message.id, MessageModel.sent_at <= utc_now()))
+    sent_at, stored_deleted_at = result.one()
+    assert sent_at <= stored_deleted_at == deleted_at
+
@@ -0,0 +1,60 @@
+import asyncio
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from databases.databases import ChatModel, MessageModel, UserModel
+from chats.ingest import MessageWriter
+from chats.summary import create_summary
+
+pytestmark = pytest.mark.anyio
+
+
+async def add_chat(db) -> tuple[int, int]:
+    user = UserModel(name="Name", lastname="Last", hash_pwd="", bio="", email="user@example.com")
+    chat = ChatModel(is_private=False, name="chat")
+    db.add_all([user, chat])
+    await db.flush()
+    create_summary(db, chat.id)
+    await db.commit()
+    return user.id, chat.id
+
+
+async def stored_texts(db) -> dict[int, str]:
+    result = await db.execute(select(MessageModel.id, MessageModel.text))
+    return dict(result.all())
+
+
+async def test_batch_pairs_ids_with_callers(db):
+    user_id, chat_id = await add_chat(db)
+    writer = MessageWriter()
+    results = await asyncio.gather(*(writer.submit(user_id, chat_id, f"message {i}", []) for i in range(5)))
+    await writer.close()
+    assert [message.text for message, _ in results] == [f"message {i}" for i in range(5)]
+    assert len({message.id for message, _ in results}) == 5
+    assert await stored_texts(db) == {message.id: message.text for message, _ in results}
+
+
+async def test_close_fails_pending_messages(db):
+    user_id, chat_id = await add_chat(db)
+    writer = MessageWriter()
+    submits = [asyncio.create_task(writer.submit(user_id, chat_id, f"message {i}", [])) for i in range(3)]
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    await writer.close()
+    results = await asyncio.wait_for(asyncio.gather(*submits, return_exceptions=True), 5)
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert await stored_texts(db) == {}
+
+
+async def test_failed_row_falls_back_to_single_commits(db):
+    user_id, chat_id = await add_chat(db)
+    writer = MessageWriter()
+    results = await asyncio.gather(writer.submit(user_id, chat_id, "first", []),
+                                   writer.submit(user_id, chat_id + 1, "orphan", []),
+                                   writer.submit(user_id, chat_id, "last", []),
+                                   return_exceptions=True)
+    await writer.close()
+    first, orphan, last = results
+    assert isinstance(orphan, IntegrityError)
+    assert (first[0].text, last[0].text) == ("first", "last")
+    assert await stored_texts(db) == {first[0].id: "first", last[0].id: "last"}
@@ -0,0 +1,23 @@
+import pytest
+from sqlalchemy import select
+from databases.databases import OutboxModel
+from chats.outbox import enqueue, outbox_handler, outbox_worker
+
+pytestmark = pytest.mark.anyio
+
+delivered = []
+
+
+@outbox_handler("test.event")
+async def record_event(db, payload: dict, idempotency_key: str):
+    delivered.append(payload["value"])
+
+
+async def test_outbox_drains_pending_events(db):
+    delivered.clear()
+    await enqueue(db, "test.event", 1, {"value": 1})
+    await enqueue(db, "test.event", 1, {"value": 1})
+    await db.commit()
+    assert await outbox_worker.drain() == 1
+    assert delivered == [1]
+    assert (await db.execute(select(OutboxModel))).scalars().all() == []
@@ -0,0 +1,49 @@
+import uuid
+from datetime import timedelta
+from pathlib import Path as PathLib
+import pytest
+from sqlalchemy import select
+from databases.databases import AttachmentModel, BlobModel, ChatModel, MessageModel, UserModel, utc_now
+from chats.purge import PURGE_MIN_AGE_SECONDS, purger
+from chats.summary import create_summary
+from media.MediaInfo import MEDIA_ROOT
+
+pytestmark = pytest.mark.anyio
+
+
+def media_file(name: str) -> str:
+    path = PathLib(MEDIA_ROOT) / "attachments" / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"data")
+    return f"attachments/{name}"
+
+
+async def test_drain_removes_aged_tombstones_and_their_files(db):
+    user = UserModel(name="Name", lastname="Last", hash_pwd="", bio="", email="user@example.com")
+    chat = ChatModel(is_private=False, name="chat")
+    db.add_all([user, chat])
+    await db.flush()
+    create_summary(db, chat.id)
+    aged = utc_now() - timedelta(seconds=PURGE_MIN_AGE_SECONDS + 60)
+    old = MessageModel(user_id=user.id, chat_id=chat.id, text="old", deleted_at=aged)
+    recent = MessageModel(user_id=user.id, chat_id=chat.id, text="recent", deleted_at=utc_now())
+    live = MessageModel(user_id=user.id, chat_id=chat.id, text="live")
+    sha256 = uuid.uuid4().hex * 2
+    blob = BlobModel(sha256=sha256, filepath=media_file(sha256), size=4, refcount=1)
+    db.add_all([old, recent, live, blob])
+    await db.flush()
+    legacy = media_file(f"{uuid.uuid4().hex}.txt")
+    db.add_all([
+        AttachmentModel(message_id=old.id, filename="a.txt", filepath=blob.filepath, content_type="text/plain",
+                        size=4, sha256=sha256),
+        AttachmentModel(message_id=old.id, filename="b.txt", filepath=legacy, content_type="text/plain", size=4)
+    ])
+    await db.commit()
+
+    assert await purger.drain() == 1
+    assert await purger.drain() == 0
+    result = await db.execute(select(MessageModel.text).order_by(MessageModel.id))
+    assert result.scalars().all() == ["recent", "live"]
+    assert (await db.execute(select(BlobModel))).scalars().all() == []
+    assert not (PathLib(MEDIA_ROOT) / blob.filepath).exists()
+    assert not (PathLib(MEDIA_ROOT) / legacy).exists()
@@ -0,0 +1,51 @@
+# TEST_REDIS_URL=redis://localhost:6379/15 also runs these against the redis backend
+import asyncio
+import os
+import uuid
+import pytest
+from fastapi import HTTPException, Response
+from auth import ratelimit
+from auth.ratelimit import MemoryBuckets, RateLimit, hit
+
+pytestmark = pytest.mark.anyio
+
+BACKENDS = ["memory", "redis"] if os.getenv("TEST_REDIS_URL") else ["memory"]
+
+
+@pytest.fixture(params=BACKENDS)
+def store(request, monkeypatch):
+    if request.param == "redis":
+        store = ratelimit.RedisBuckets(os.environ["TEST_REDIS_URL"])
+    else:
+        store = MemoryBuckets()
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(ratelimit, "rate_limit_store", store)
+    return store
+
+
+async def test_burst_past_limit_is_rejected(store):
+    limit = RateLimit(f"test_{uuid.uuid4().hex}", "3/30")
+    for remaining in (2, 1, 0):
+        response = Response()
+        await hit(limit, 1, response)
+        assert response.headers["RateLimit-Remaining"] == str(remaining)
+    with pytest.raises(HTTPException) as exc:
+        await hit(limit, 1, Response())
+    assert exc.value.status_code == 429
+    assert exc.value.headers["Retry-After"] == "10"
+    assert exc.value.headers["RateLimit-Remaining"] == "0"
+    await hit(limit, 2, Response())
+
+
+async def test_bucket_refills_after_emission_interval(store):
+    limit = RateLimit(f"test_{uuid.uuid4().hex}", "2/0.4")
+    await hit(limit, 1, Response())
+    await hit(limit, 1, Response())
+    with pytest.raises(HTTPException):
+        await hit(limit, 1, Response())
+    await asyncio.sleep(limit.interval)
+    response = Response()
+    await hit(limit, 1, response)
+    assert response.headers["RateLimit-Remaining"] == "0"
+    with pytest.raises(HTTPException):
+        await hit(limit, 1, Response())
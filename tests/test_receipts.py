@@ -0,0 +1,30 @@
+import asyncio
+import pytest
+from sqlalchemy import select
+from databases.databases import ChatModel, ChatMember, ChatSummary, UserModel
+from chats.receipts import AckBuffer
+
+pytestmark = pytest.mark.anyio
+
+
+async def add_member(db) -> tuple[int, int]:
+    user = UserModel(name="Name", lastname="Last", hash_pwd="", bio="", email="user@example.com")
+    chat = ChatModel(is_private=False, name="chat")
+    db.add_all([user, chat])
+    await db.flush()
+    db.add_all([ChatSummary(chat_id=chat.id, last_message_id=10), ChatMember(chat_id=chat.id, user_id=user.id)])
+    await db.commit()
+    return chat.id, user.id
+
+
+async def test_close_keeps_acks_from_an_interrupted_flush(db):
+    chat_id, user_id = await add_member(db)
+    buffer = AckBuffer()
+    buffer.ack(chat_id, user_id, read_message_id=5, delivered_message_id=7)
+    buffer.full.set()
+    for _ in range(3):
+        await asyncio.sleep(0)
+    await buffer.close()
+    result = await db.execute(select(ChatMember.last_read_message_id, ChatMember.last_delivered_message_id)
+                              .where(ChatMember.chat_id == chat_id, ChatMember.user_id == user_id))
+    assert result.one() == (5, 7)
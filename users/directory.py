@@ -0,0 +1,189 @@
+import asyncio
+import bisect
+import os
+from collections import Counter
+from sqlalchemy import select, or_, and_, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from databases.databases import AsyncSessionLocal, UserModel
+
+USER_DIRECTORY_INDEX = os.getenv("USER_DIRECTORY_INDEX", "1") == "1"
+DIRECTORY_LOAD_BATCH_SIZE = int(os.getenv("DIRECTORY_LOAD_BATCH_SIZE", "10000"))
+MAX_CANDIDATES = 2000
+LOAD_YIELD_EVERY = 1000
+MIN_FUZZY_LENGTH = 4
+
+
+class UserDirectory:
+    def __init__(self):
+        self.ready = False
+        self.users: dict[int, tuple[str, ...]] = {}
+        self.postings: dict[str, list[int]] = {}
+        self.tokens: list[str] = []
+        self.trigrams: dict[tuple[str, int], set[str]] = {}
+        self._deleted_while_loading: set[int] = set()
+
+    async def load(self, session_maker=AsyncSessionLocal):
+        last_id = 0
+        while True:
+            async with session_maker() as db:
+                result = await db.execute(select(UserModel.id, UserModel.name, UserModel.lastname, UserModel.email)
+                                          .where(UserModel.id > last_id, UserModel.deleted_at.is_(None))
+                                          .order_by(UserModel.id).limit(DIRECTORY_LOAD_BATCH_SIZE))
+                rows = result.all()
+            if not rows:
+                break
+            for i, (user_id, name, lastname, email) in enumerate(rows):
+                if user_id not in self.users and user_id not in self._deleted_while_loading:
+                    self.add(user_id, name, lastname, email)
+                if i % LOAD_YIELD_EVERY == 0:
+                    await asyncio.sleep(0)
+            last_id = rows[-1].id
+        self.tokens.sort()
+        self._deleted_while_loading.clear()
+        self.ready = True
+
+    def add(self, user_id: int, name: str, lastname: str, email: str):
+        self._discard(user_id)
+        tokens = user_tokens(name, lastname, email)
+        self.users[user_id] = tokens
+        for token in set(tokens):
+            ids = self.postings.get(token)
+            if ids is None:
+                self.postings[token] = [user_id]
+                if self.ready:
+                    bisect.insort(self.tokens, token)
+                else:
+                    self.tokens.append(token)
+                if "@" not in token:
+                    for trigram in trigrams(token):
+                        self.trigrams.setdefault((trigram, len(token)), set()).add(token)
+            else:
+                ids.append(user_id)
+
+    def update(self, user_id: int, name: str, lastname: str):
+        tokens = self.users.get(user_id)
+        if tokens is not None:
+            self.add(user_id, name, lastname, tokens[-1])
+
+    def remove(self, user_id: int):
+        if not self.ready:
+            self._deleted_while_loading.add(user_id)
+        self._discard(user_id)
+
+    def _discard(self, user_id: int):
+        tokens = self.users.pop(user_id, None)
+        if tokens is None:
+            return
+        for token in set(tokens):
+            ids = self.postings[token]
+            ids.remove(user_id)
+            if ids:
+                continue
+            del self.postings[token]
+            if self.ready:
+                del self.tokens[bisect.bisect_left(self.tokens, token)]
+            else:
+                self.tokens.remove(token)
+            if "@" not in token:
+                for trigram in trigrams(token):
+                    self.trigrams[trigram, len(token)].discard(token)
+
+    def search(self, query: str, limit: int) -> list[int]:
+        terms = query.lower().split()
+        if not terms:
+            return []
+        driver = max(terms, key=len)
+        scores = self.match_term(driver, limit)
+        others = list(terms)
+        others.remove(driver)
+        for term in others:
+            fuzzy = set(self.fuzzy_tokens(term)) if len(term) >= MIN_FUZZY_LENGTH and "@" not in term else set()
+            scores = {user_id: score + term_score for user_id, score in scores.items()
+                      if (term_score := self.score_user(user_id, term, fuzzy)) is not None}
+        return sorted(scores, key=lambda user_id: (scores[user_id], user_id))[:limit]
+
+    def match_term(self, term: str, limit: int) -> dict[int, int]:
+        matches = {}
+        position = bisect.bisect_left(self.tokens, term)
+        while position < len(self.tokens) and len(matches) < MAX_CANDIDATES:
+            token = self.tokens[position]
+            if not token.startswith(term):
+                break
+            score = 0 if token == term else 1
+            for user_id in self.postings[token][:MAX_CANDIDATES]:
+                if matches.get(user_id, 2) > score:
+                    matches[user_id] = score
+            position += 1
+        if len(matches) < limit and len(term) >= MIN_FUZZY_LENGTH and "@" not in term:
+            for token in self.fuzzy_tokens(term):
+                for user_id in self.postings[token][:MAX_CANDIDATES]:
+                    matches.setdefault(user_id, 2)
+                if len(matches) >= MAX_CANDIDATES:
+                    break
+        return matches
+
+    def score_user(self, user_id: int, term: str, fuzzy: set[str]) -> int | None:
+        best = None
+        for token in self.users[user_id]:
+            if token == term:
+                return 0
+            if token.startswith(term):
+                best = 1
+            elif best is None and token in fuzzy:
+                best = 2
+        return best
+
+    def fuzzy_tokens(self, term: str) -> list[str]:
+        term_trigrams = trigrams(term)
+        max_distance = fuzzy_distance(term)
+        needed = len(term_trigrams) - 3 * max_distance
+        shared = Counter()
+        for length in range(len(term) - max_distance, len(term) + max_distance + 1):
+            for trigram in term_trigrams:
+                shared.update(self.trigrams.get((trigram, length), ()))
+        return [token for token, count in shared.items()
+                if count >= needed and edit_distance(token, term, max_distance) <= max_distance]
+
+
+def fuzzy_distance(term: str) -> int:
+    return 1 if len(term) < 10 else 2
+
+
+def user_tokens(name: str, lastname: str, email: str) -> tuple[str, ...]:
+    return (*name.lower().split(), *lastname.lower().split(), email.lower())
+
+
+def trigrams(token: str) -> set[str]:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def prefix_range(column, prefix: str):
+    return and_(column >= prefix, column < prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+
+async def search_users_in_db(db: AsyncSession, query: str, limit: int) -> list[int]:
+    db_request = select(UserModel.id).where(UserModel.deleted_at.is_(None))
+    for term in query.lower().split():
+        db_request = db_request.where(or_(
+            prefix_range(UserModel.name_key, term),
+            prefix_range(UserModel.lastname_key, term),
+            prefix_range(func.lower(UserModel.email), term)
+        ))
+    result = await db.execute(db_request.order_by(UserModel.id).limit(limit))
+    return result.scalars().all()
+
+
+user_directory = UserDirectory()
@@ -0,0 +1,60 @@
+import os
+from pathlib import Path as PathLib
+from sqlalchemy import select, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from auth.cache import TTLCache
+from databases.databases import UserModel, PictureModel
+from media.MediaInfo import MEDIA_ROOT
+from media.pictures import default_avatar
+
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "50000"))
+PROFILE_CACHE_TTL_SECONDS = float(os.getenv("PROFILE_CACHE_TTL_SECONDS", "300"))
+MAX_BATCH_PROFILES = 500
+
+profile_cache = TTLCache(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL_SECONDS)
+
+
+def picture_etag(picture_id: int, size: int) -> str:
+    return f"picture-{picture_id}-{size}"
+
+
+def default_avatar_etag() -> str:
+    stat = (PathLib(MEDIA_ROOT) / default_avatar).stat()
+    return f"default-{int(stat.st_mtime)}-{stat.st_size}"
+
+
+async def load_profiles(db: AsyncSession, user_ids: list[int]) -> dict[int, dict]:
+    profiles = {}
+    misses = []
+    for user_id in user_ids:
+        profile = profile_cache.get(user_id)
+        if profile is None:
+            misses.append(user_id)
+        else:
+            profiles[user_id] = profile
+    if misses:
+        result = await db.execute(
+            select(UserModel.id, UserModel.name, UserModel.lastname, UserModel.bio, PictureModel.id, PictureModel.size)
+            .outerjoin(PictureModel, and_(PictureModel.owner_id == UserModel.id, PictureModel.placement == "avatar"))
+            .where(UserModel.id.in_(misses), UserModel.deleted_at.is_(None))
+        )
+        for user_id, name, lastname, bio, picture_id, picture_size in result.all():
+            profile = {
+                "id": user_id,
+                "name": name,
+                "lastname": lastname,
+                "bio": bio,
+                "avatar_url": f"/users/{user_id}/pictures/avatar",
+                "avatar_etag": f'"{picture_etag(picture_id, picture_size)}"' if picture_id else None
+            }
+            profile_cache.set(user_id, profile)
+            profiles[user_id] = profile
+    if any(profile["avatar_etag"] is None for profile in profiles.values()):
+        etag = f'"{default_avatar_etag()}"'
+        profiles = {user_id: {**profile, "avatar_etag": profile["avatar_etag"] or etag}
+                    for user_id, profile in profiles.items()}
+    return profiles
+
+
+def invalidate_profile(user_id: int):
+    profile_cache.invalidate(user_id)
@@ -1,54 +1,44 @@
-import uuid
 from typing import Annotated, List
-from fastapi.responses import FileResponse
-from fastapi import APIRouter, Depends, Path, UploadFile, File, Form
+from fastapi import APIRouter, Depends, Path, Query, UploadFile, File, Form, Request, Response, BackgroundTasks
 from fastapi import HTTPException, status
 from media.MediaInfo import validate_file_type
 from pydantic import BaseModel, Field
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete, update
-from sqlalchemy.orm import aliased
+from sqlalchemy import select, delete, update, or_
 from media.MediaInfo import MAX_FILE_SIZE, MAX_TOTAL_SIZE, ALLOWED_CONTENT_TYPES, get_ext, MEDIA_ROOT
 from media.pictures import ALLOWED_PICTURE_TYPE, default_avatar, default_avatar_name
-from auth.validation import get_current_user
-from databases.databases import get_db, UserModel, ChatMember, ChatModel, MessageModel, AttachmentModel, PictureModel
+from auth.validation import get_current_user, revoke_user
+from auth.ratelimit import hit, limit_by_user, NEW_CHAT_USER_LIMIT, SEND_MESSAGE_USER_LIMIT
+from chats.members import membership
+from chats.messages.messages import post_message
+from chats.direct import find_direct_chat, create_direct_chat
+from media.uploads import store_upload
+from media.responses import media_response
+from media.thumbnails import check_width, picture_variants, cached_variant, generate_variants
+from users.directory import user_directory, search_users_in_db
+from friends.graph import load_friend_ids, invalidate_friends
+from users.profiles import MAX_BATCH_PROFILES, load_profiles, invalidate_profile, picture_etag, default_avatar_etag
+from databases.databases import get_db, utc_now, UserModel, ChatMember, PictureModel, UserFriends
 from pathlib import Path as PathLib
 users_router = APIRouter(prefix="/users", tags=["users"])
 
 
-@users_router.post("/{user2_id}/message")
-async def lazy_creation_chat(text: Annotated[str, Form()],  files: List[UploadFile] = File(default=None),
+@users_router.post("/{user2_id}/message", dependencies=[Depends(limit_by_user(SEND_MESSAGE_USER_LIMIT))])
+async def lazy_creation_chat(response: Response, text: Annotated[str, Form()],
+                             files: List[UploadFile] = File(default=None),
                              user2_id: int = Path(ge=1), user_id: int = Depends(get_current_user),
                              db: AsyncSession = Depends(get_db)):
     if files is None:
         files = []
-    result = await db.execute(select(UserModel.id).where(UserModel.id == user2_id))
+    result = await db.execute(select(UserModel.id).where(UserModel.id == user2_id, UserModel.deleted_at.is_(None)))
     if not result.scalar_one_or_none():
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     if user_id == user2_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot create chat with yourself")
-    cm1 = aliased(ChatMember)
-    cm2 = aliased(ChatMember)
-    request = (
-        select(ChatModel.id)
-        .join(cm1, ChatModel.id == cm1.chat_id)
-        .join(cm2, ChatModel.id == cm2.chat_id)
-        .where(
-            ChatModel.is_private == True,
-            cm1.user_id == user_id,
-            cm2.user_id == user2_id
-        )
-    )
-    result = await db.execute(request)
-    if result.scalar_one_or_none():
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail="chat already exists"
-        )
     total_size = 0
     for file in files:
-        if file.size is None or file.size > MAX_FILE_SIZE:
+        if file.size is not None and file.size > MAX_FILE_SIZE:
             raise HTTPException(
                 status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
                 detail=f"File too large. Max size is {MAX_FILE_SIZE // (1024 * 1024)} MB"
@@ -58,46 +48,20 @@ async def lazy_creation_chat(text: Annotated[str, Form()],  files: List[UploadFi
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="File type not allowed"
             )
-        total_size += file.size
+        total_size += file.size or 0
 
     if total_size > MAX_TOTAL_SIZE:
         raise HTTPException(
             status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
             detail=f"Total files size too large. Max total size is {MAX_TOTAL_SIZE // (1024 * 1024)} MB"
         )
-    new_chat = ChatModel(
-        is_private=True,
-        name=None,
-        status="opened"
-    )
-    db.add(new_chat)
-    await db.flush()
-    new_message = MessageModel(user_id=user_id, chat_id=new_chat.id, text=text)
-    db.add(new_message)
-    await db.flush()
-    member1 = ChatMember(chat_id=new_chat.id, user_id=user_id, role="member")
-    member2 = ChatMember(chat_id=new_chat.id, user_id=user2_id, role="member")
-    db.add(member1)
-    db.add(member2)
-    attachment_urls = []
-    for file in files:
-        ext = PathLib(file.filename).suffix.lower() if file.filename else ""
-        unique_filename = f"{uuid.uuid4().hex}{ext}"
-        filepath = f"attachments/{unique_filename}"
-        full_path = PathLib("media") / filepath
-        with open(full_path, "wb") as f:
-            f.write(await file.read())
-        attachment = AttachmentModel(
-            message_id=new_message.id,
-            filename=file.filename or unique_filename,
-            filepath=filepath,
-            content_type=file.content_type,
-            size=file.size
-        )
-        db.add(attachment)
-        attachment_urls.append(f"/media/{filepath}")
-    await db.commit()
-    return {"ok": True, "chat_id": new_chat.id, "message_id": new_message.id, "uploaded_files": attachment_urls}
+    chat_id = await find_direct_chat(db, user_id, user2_id)
+    if chat_id is None:
+        await hit(NEW_CHAT_USER_LIMIT, user_id, response)
+        chat_id = await create_direct_chat(db, user_id, user2_id)
+    new_message, attachment_ids, stored_files = await post_message(db, user_id, chat_id, text, files)
+    attachment_urls = [f"/media/{stored.filepath}" for stored in stored_files]
+    return {"ok": True, "chat_id": chat_id, "message_id": new_message.id, "uploaded_files": attachment_urls}
 
 
 class PatchUserProfileSchema(BaseModel):
@@ -110,31 +74,46 @@ class PatchUserProfileSchema(BaseModel):
 async def patch_user_profile(schema: PatchUserProfileSchema, user_id: int = Depends(get_current_user),
                              db: AsyncSession = Depends(get_db)):
     result = await db.execute(update(UserModel).where(UserModel.id == user_id)
-                              .values(name=schema.name, lastname=schema.lastname, bio=schema.bio))
+                              .values(name=schema.name, lastname=schema.lastname, bio=schema.bio,
+                                      name_key=schema.name.lower(), lastname_key=schema.lastname.lower()))
     if result.rowcount == 0:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="No profile found"
         )
     await db.commit()
+    invalidate_profile(user_id)
+    user_directory.update(user_id, schema.name, schema.lastname)
     return{"ok": True}
 
 
 @users_router.delete("/profile")
 async def delete_user_profile(user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
-    result = await db.execute(delete(UserModel).where(UserModel.id == user_id))
+    friend_ids = await load_friend_ids(db, user_id)
+    result = await db.execute(select(ChatMember.chat_id).where(ChatMember.user_id == user_id))
+    chat_ids = result.scalars().all()
+    result = await db.execute(update(UserModel).where(UserModel.id == user_id, UserModel.deleted_at.is_(None))
+                              .values(deleted_at=utc_now()))
     if result.rowcount == 0:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="No account found"
         )
+    await db.execute(delete(UserFriends).where(or_(UserFriends.user_id == user_id, UserFriends.friend_id == user_id)))
+    await db.execute(delete(ChatMember).where(ChatMember.user_id == user_id))
     await db.commit()
+    revoke_user(user_id)
+    invalidate_profile(user_id)
+    user_directory.remove(user_id)
+    invalidate_friends(friend_ids | {user_id})
+    for chat_id in chat_ids:
+        membership.members_removed(chat_id, (user_id,))
     return {"ok": True}
 
 
 @users_router.get("/profile")
 async def get_user_profile(user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(UserModel).where(UserModel.id == user_id))
+    result = await db.execute(select(UserModel).where(UserModel.id == user_id, UserModel.deleted_at.is_(None)))
     data = result.scalar_one_or_none()
     if not data:
         raise HTTPException(
@@ -160,53 +139,59 @@ async def delete_avatar(user_id: int = Depends(get_current_user), db: AsyncSessi
             detail="Nothing found or you have no permission"
         )
     await db.commit()
+    invalidate_profile(user_id)
     return {"ok": True}
 
 @users_router.post("/profile/pictures/wall")
-async def upload_wall_photo(file: UploadFile = File(default=None), user_id: int = Depends(get_current_user),
-                            db: AsyncSession = Depends(get_db)):
+async def upload_wall_photo(background_tasks: BackgroundTasks, file: UploadFile = File(default=None),
+                            user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     filetype = await validate_file_type(file)
     if filetype != ALLOWED_PICTURE_TYPE:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"File should be {ALLOWED_PICTURE_TYPE} format"
         )
-    ext = get_ext(filetype)
-    unique_filename = f"{uuid.uuid4().hex}.{ext}"
-    filepath = f"pictures/{unique_filename}"
-    full_path = PathLib("media") / filepath
-    with open(full_path, "wb") as f:
-        f.write(await file.read())
+    stored = await store_upload(file, "pictures", f".{get_ext(filetype)}")
     picture = PictureModel(
-        filename=file.filename or unique_filename,
-        filepath=filepath,
-        size=file.size,
+        filename=file.filename or PathLib(stored.filepath).name,
+        filepath=stored.filepath,
+        size=stored.size,
         owner_id=user_id,
         placement="wall"
     )
     db.add(picture)
     await db.commit()
+    background_tasks.add_task(generate_variants, picture.id)
     return {"ok": True}
 
 
 @users_router.get("/{user2_id}/pictures/wall")
-async def get_wall_photos(user2_id: int = Path(ge=1), user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+async def get_wall_photos(user2_id: int = Path(ge=1), size: int | None = Query(default=None),
+                          user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    check_width(size)
     result = await get_pictures(user2_id, db, "wall")
     return {
         "ok": True,
-        "URLS": [file.filepath for file in result]
+        "URLS": await picture_urls(db, result, size)
     }
 
 
 @users_router.get("/profile/pictures/wall")
-async def get_profile_wall_photos(user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+async def get_profile_wall_photos(size: int | None = Query(default=None), user_id: int = Depends(get_current_user),
+                                  db: AsyncSession = Depends(get_db)):
+    check_width(size)
     result = await get_pictures(user_id, db, "wall")
     return {
         "ok": True,
-        "URLS": [file.filepath for file in result]
+        "URLS": await picture_urls(db, result, size)
     }
 
 
+async def picture_urls(db: AsyncSession, pictures, size: int | None) -> list[str]:
+    variants = await picture_variants(db, pictures, size) if size else {}
+    return [variants[file.id].filepath if file.id in variants else file.filepath for file in pictures]
+
+
 async def get_pictures(user_id, db: AsyncSession, placement: str):
     result = await db.execute(select(PictureModel).where(PictureModel.owner_id == user_id, PictureModel.placement == placement))
     pictures = result.scalars().all()
@@ -214,51 +199,62 @@ async def get_pictures(user_id, db: AsyncSession, placement: str):
 
 
 @users_router.get("/profile/pictures/avatar")
-async def get_profile_avatar(user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+async def get_profile_avatar(request: Request, size: int | None = Query(default=None),
+                             user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    check_width(size)
     result = await get_pictures(user_id, db, "avatar")
-    avatar = next(iter(result), None)
-    if avatar:
-        return FileResponse(
-            path=PathLib(MEDIA_ROOT) / avatar.filepath,
-            media_type=ALLOWED_PICTURE_TYPE,
-            headers={
-                "Content-Disposition": f'inline; filename="{avatar.filename}"'
-            }
-        )
-    else:
-        return FileResponse(
-            path=PathLib(MEDIA_ROOT) / default_avatar,
-            media_type=ALLOWED_PICTURE_TYPE,
-            headers={
-                "Content-Disposition": f'inline; filename="{default_avatar_name}"'
-            }
-        )
+    return await avatar_response(request, db, next(iter(result), None), size)
 
 
 @users_router.get("/{user2_id}/pictures/avatar")
-async def get_avatar(user2_id: int = Path(ge=1), user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+async def get_avatar(request: Request, user2_id: int = Path(ge=1), size: int | None = Query(default=None),
+                     user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    check_width(size)
     result = await get_pictures(user2_id, db, "avatar")
-    avatar = next(iter(result), None)
+    return await avatar_response(request, db, next(iter(result), None), size)
+
+
+async def avatar_response(request: Request, db: AsyncSession, avatar: PictureModel | None, size: int | None):
     if avatar:
-        return FileResponse(
-            path=PathLib(MEDIA_ROOT) / avatar.filepath,
+        variant = (await picture_variants(db, [avatar], size)).get(avatar.id) if size else None
+        if variant:
+            return media_response(
+                request,
+                PathLib(MEDIA_ROOT) / variant.filepath,
+                etag=f"picture-{avatar.id}-{size}-{variant.size}",
+                media_type=variant.media_type,
+                filename=PathLib(variant.filepath).name,
+                last_modified=avatar.date
+            )
+        return media_response(
+            request,
+            PathLib(MEDIA_ROOT) / avatar.filepath,
+            etag=picture_etag(avatar.id, avatar.size),
             media_type=ALLOWED_PICTURE_TYPE,
-            headers={
-                "Content-Disposition": f'inline; filename="{avatar.filename}"'
-            }
+            filename=avatar.filename,
+            last_modified=avatar.date
         )
-    else:
-        return FileResponse(
-            path=PathLib(MEDIA_ROOT) / default_avatar,
-            media_type=ALLOWED_PICTURE_TYPE,
-            headers={
-                "Content-Disposition": f'inline; filename="{default_avatar_name}"'
-            }
+    variant = await cached_variant(default_avatar, size) if size else None
+    if variant:
+        return media_response(
+            request,
+            PathLib(MEDIA_ROOT) / variant.filepath,
+            etag=f"default-{size}-{variant.size}",
+            media_type=variant.media_type,
+            filename=PathLib(variant.filepath).name
         )
+    return media_response(
+        request,
+        PathLib(MEDIA_ROOT) / default_avatar,
+        etag=default_avatar_etag(),
+        media_type=ALLOWED_PICTURE_TYPE,
+        filename=default_avatar_name
+    )
 
 
 @users_router.post("/{user2_id}/pictures/avatar")
-async def upload_avatar(file: UploadFile = File(default=None), user2_id: int = Path(ge=1), user_id: int = Depends(get_current_user),
+async def upload_avatar(background_tasks: BackgroundTasks, file: UploadFile = File(default=None),
+                        user2_id: int = Path(ge=1), user_id: int = Depends(get_current_user),
                         db: AsyncSession = Depends(get_db)):
     filetype = await validate_file_type(file)
     if filetype != ALLOWED_PICTURE_TYPE:
@@ -269,27 +265,50 @@ async def upload_avatar(file: UploadFile = File(default=None), user2_id: int = P
     await db.execute(update(PictureModel)
                      .where(PictureModel.owner_id == user2_id, PictureModel.placement == "avatar")
                      .values(placement="wall"))
-    ext = get_ext(filetype)
-    unique_filename = f"{uuid.uuid4().hex}.{ext}"
-    filepath = f"pictures/{unique_filename}"
-    full_path = PathLib("media") / filepath
-    with open(full_path, "wb") as f:
-        f.write(await file.read())
+    stored = await store_upload(file, "pictures", f".{get_ext(filetype)}")
     picture = PictureModel(
-        filename=file.filename or unique_filename,
-        filepath=filepath,
-        size=file.size,
+        filename=file.filename or PathLib(stored.filepath).name,
+        filepath=stored.filepath,
+        size=stored.size,
         owner_id=user2_id,
         placement="avatar"
     )
     db.add(picture)
     await db.commit()
+    invalidate_profile(user2_id)
+    background_tasks.add_task(generate_variants, picture.id)
     return {"ok": True}
 
 
+@users_router.get("/search")
+async def search_users(q: str = Query(min_length=1, max_length=64), limit: int = Query(20, ge=1, le=50),
+                       user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    if user_directory.ready:
+        user_ids = user_directory.search(q, limit)
+    else:
+        user_ids = await search_users_in_db(db, q, limit)
+    profiles = await load_profiles(db, user_ids)
+    return {
+        "ok": True,
+        "users": [profiles[id] for id in user_ids if id in profiles]
+    }
+
+
+@users_router.get("/batch")
+async def get_users_batch(ids: List[int] = Query(min_length=1, max_length=MAX_BATCH_PROFILES),
+                          user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    user_ids = list(dict.fromkeys(ids))
+    profiles = await load_profiles(db, user_ids)
+    return {
+        "ok": True,
+        "users": [profiles[id] for id in user_ids if id in profiles],
+        "missing": [id for id in user_ids if id not in profiles]
+    }
+
+
 @users_router.get("/{user_id}")
 async def get_user(user_id: int = Path(ge=1), requester_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(UserModel).where(UserModel.id == user_id))
+    result = await db.execute(select(UserModel).where(UserModel.id == user_id, UserModel.deleted_at.is_(None)))
     data = result.scalar_one_or_none()
     if not data:
         raise HTTPException(